@@ -0,0 +1,125 @@
+from array import array
+from collections import OrderedDict
+
+from common.event import Event, EventType
+
+
+class EventStore(object):
+    # Keeps every event once, as one row of a set of int columns. Characters and places are interned, and each
+    # character has an array with the rows of the events it takes part in. Events are only built on access, as
+    # Event tuples, so the callers that iterate over events do not change.
+    ACTIONS = [event_type.value for event_type in EventType]
+    ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+    NONE = -1
+
+    def __init__(self):
+        self.t = array('l')
+        self.id = array('l')
+        self.is_story_arc = array('b')
+        self.action = array('b')
+        self.protagonist = array('i')
+        self.antagonist = array('i')
+        self.origin = array('i')
+        self.destination = array('i')
+
+        self.characters = []
+        self.character_ids = {}
+        self.places = []
+        self.place_ids = {}
+        self.character_rows = {}
+
+    @classmethod
+    def from_dictionary(cls, events_dictionary):
+        event_store = cls()
+        rows_by_id = {}
+        for event_data in events_dictionary['GLOBAL']:
+            event = Event(**event_data) if isinstance(event_data, dict) else Event(*event_data)
+            rows_by_id[event.id] = event_store.add_event(event, index_characters=False)
+
+        for character, character_events in events_dictionary.items():
+            if character == 'GLOBAL':
+                continue
+            rows = event_store._get_character_rows(character)
+            for event_data in character_events:
+                rows.append(rows_by_id[event_data['id'] if isinstance(event_data, dict) else event_data[1]])
+        return event_store
+
+    @classmethod
+    def from_log(cls, log, characters):
+        # The world log as written by World, with the events of every character as a view over the shared store
+        event_store = cls.from_dictionary(log['EVENTS'])
+        character_events = OrderedDict((character, event_store.get_events(character)) for character in characters)
+        return event_store, character_events
+
+    def add_event(self, event, index_characters=True):
+        if len(event.protagonists) != 1 or len(event.antagonists) > 1 or len(event.places) not in (0, 2) \
+                or event.direct_complements or event.indirect_complements:
+            raise Exception(f'Event {event.id} does not fit in the event store')
+
+        row = len(self.id)
+        self.t.append(event.t)
+        self.id.append(event.id)
+        self.is_story_arc.append(event.is_story_arc)
+        self.action.append(self.ACTION_CODES[event.action])
+        self.protagonist.append(self._intern(event.protagonists[0], self.characters, self.character_ids))
+        self.antagonist.append(self._intern(event.antagonists[0], self.characters, self.character_ids)
+                               if event.antagonists else self.NONE)
+        self.origin.append(self._intern(event.places[0], self.places, self.place_ids) if event.places else self.NONE)
+        self.destination.append(self._intern(event.places[1], self.places, self.place_ids)
+                                if event.places else self.NONE)
+
+        if index_characters:
+            for character in event.protagonists + event.antagonists:
+                self._get_character_rows(character).append(row)
+        return row
+
+    @staticmethod
+    def _intern(name, names, ids):
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+        return ids[name]
+
+    def _get_character_rows(self, character):
+        if character not in self.character_rows:
+            self.character_rows[character] = array('l')
+        return self.character_rows[character]
+
+    def get_event(self, row):
+        antagonist = self.antagonist[row]
+        origin = self.origin[row]
+        return Event(self.t[row], self.id[row], bool(self.is_story_arc[row]), self.ACTIONS[self.action[row]],
+                     [self.characters[self.protagonist[row]]],
+                     [self.characters[antagonist]] if antagonist != self.NONE else [], [], [],
+                     [self.places[origin], self.places[self.destination[row]]] if origin != self.NONE else [])
+
+    def get_events(self, character=None):
+        if character is None:
+            return self
+        return CharacterEvents(self, self.character_rows.get(character, array('l')))
+
+    def __len__(self):
+        return len(self.id)
+
+    def __getitem__(self, row):
+        return self.get_event(row)
+
+    def __iter__(self):
+        for row in range(len(self.id)):
+            yield self.get_event(row)
+
+
+class CharacterEvents(object):
+    def __init__(self, event_store, rows):
+        self.event_store = event_store
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        return self.event_store.get_event(self.rows[index])
+
+    def __iter__(self):
+        for row in self.rows:
+            yield self.event_store.get_event(row)
@@ -0,0 +1,6 @@
+class SharedValue(object):
+    # Values that are never modified in place, so deep copies (e.g. individuals cloned by deap) can share them
+    __slots__ = ()
+
+    def __deepcopy__(self, memo):
+        return self
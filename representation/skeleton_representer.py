@@ -30,8 +30,7 @@ class SkeletonPresenter(object):
             tropes = [None for index in range(tropes_length)]
             with open(self.solution_resource, 'r') as handler:
                 lines = handler.readlines()
-                tropes_as_text = lines[-1].split(', tropes=')[1]
-                tropes = eval(tropes_as_text)
+                tropes = self._parse_solution(lines[-1])
 
         self.places_index = {id:index for index, id in enumerate(self.world['PLACES'])}
 
@@ -114,3 +113,12 @@ class SkeletonPresenter(object):
                 graph.write_pdf(f'{self.output_prefix}.pdf')
 
         nx.write_gexf(G, f'{self.output_prefix}.gexf')
+
+    @staticmethod
+    def _parse_solution(last_line):
+        # Telemetry streams are JSONL, older solution files end with 'Generation=..., tropes=[...]'
+        if last_line.lstrip().startswith('{'):
+            return json.loads(last_line)['best_genome']
+
+        tropes_as_text = last_line.split(', tropes=')[1]
+        return eval(tropes_as_text)
@@ -1,11 +1,23 @@
 import json
 
 from common.event import Event
+from common.event_store import EventStore
 
 
-class BackStory(list):
+class BackStory(object):
+    # The world backstory owns the event store, the backstory of a character is a view of the rows it takes part in
+    def __init__(self, event_store=None, character=None):
+        self.event_store = event_store if event_store is not None else EventStore()
+        self.character = character
+
     def add_event(self, event: Event) -> None:
-        self.append(event)
+        self.event_store.add_event(event)
+
+    def __len__(self):
+        return len(self.event_store.get_events(self.character))
+
+    def __iter__(self):
+        return iter(self.event_store.get_events(self.character))
 
     def get_events_as_text(self, show_labels=False):
         content = []
@@ -0,0 +1,88 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tarfile
+import time
+from collections import OrderedDict
+from random import Random
+from sys import stderr
+
+from skeleton.world import World
+
+
+class BatchSkeletonBuilder(object):
+    def __init__(self, seeds, grid_size, characters, iterations, output_prefix, show_labels=False, shard_size=1000,
+                 workers=None):
+        # Seeds are kept as text, the way the build_skeleton task receives them, so Random(seed) and the SEED in
+        # the output are the same as in a single-seed run
+        self.seeds = [str(seed) for seed in seeds]
+        self.grid_size = grid_size
+        self.characters = characters
+        self.iterations = iterations
+        self.output_prefix = output_prefix
+        self.show_labels = show_labels
+        self.shard_size = shard_size
+        self.workers = workers or os.cpu_count() or 1
+        self.shards = []
+
+    @staticmethod
+    def read_seeds(seed_range=None, seed_file=None):
+        if seed_file:
+            with open(seed_file, 'r') as handler:
+                return [line.strip() for line in handler if line.strip()]
+        if seed_range:
+            start, end = seed_range.split(':')
+            return list(range(int(start), int(end)))
+        raise Exception('A seed range (start:end) or a seed file is needed')
+
+    def run(self):
+        start = time.time()
+        arguments = [(seed, self.grid_size, self.characters, self.iterations, self.show_labels) for seed in self.seeds]
+        chunk_size = max(1, min(100, len(arguments) // (self.workers * 4)))
+
+        with multiprocessing.Pool(self.workers) as pool:
+            # Results come back in seed order, so every shard holds a contiguous slice of the seeds
+            results = pool.imap(build_skeleton_content, arguments, chunksize=chunk_size)
+            for shard_index, shard_start in enumerate(range(0, len(self.seeds), self.shard_size)):
+                shard_seeds = self.seeds[shard_start:shard_start + self.shard_size]
+                self.shards.append(self._write_shard(shard_index, shard_seeds, results))
+                print(f'Shard {shard_index} written, {shard_start + len(shard_seeds)}/{len(self.seeds)} skeletons',
+                      file=stderr)
+
+        self._write_manifest(time.time() - start)
+
+    def _write_shard(self, shard_index, shard_seeds, results):
+        shard_file = f'{self.output_prefix}_{shard_index:05d}.tar.bz2'
+        members = []
+        with tarfile.open(shard_file, 'w:bz2') as shard:
+            for seed in shard_seeds:
+                result_seed, content = next(results)
+                if result_seed != seed:
+                    raise Exception(f'Expected the skeleton of seed {seed}, got {result_seed}')
+
+                data = content.encode('utf-8')
+                member = tarfile.TarInfo(f'{seed}.json')
+                member.size = len(data)
+                shard.addfile(member, io.BytesIO(data))
+                members.append(OrderedDict([('seed', seed), ('file', member.name),
+                                            ('sha256', hashlib.sha256(data).hexdigest())]))
+
+        return OrderedDict([('file', os.path.basename(shard_file)), ('skeletons', members)])
+
+    def _write_manifest(self, elapsed_time):
+        manifest = OrderedDict([
+            ('GRID_SIZE', self.grid_size), ('CHARACTER_SIZE', self.characters), ('ITERATIONS', self.iterations),
+            ('SHOW_LABELS', self.show_labels), ('SKELETONS', len(self.seeds)), ('ELAPSED_TIME', elapsed_time),
+            ('SHARDS', self.shards)])
+        with open(f'{self.output_prefix}_manifest.json', 'w') as handler:
+            json.dump(manifest, handler, indent=2)
+
+
+def build_skeleton_content(arguments):
+    seed, grid_size, characters, iterations, show_labels = arguments
+    world = World(Random(seed), grid_size, characters, iterations)
+    world.build()
+    world.run()
+    return seed, world.build_events_content(seed, show_labels)
@@ -0,0 +1,254 @@
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from random import Random
+
+import numpy as np
+from scipy import stats
+
+from common.event import Event, EventType
+from skeleton.backstory import BackStory
+from skeleton.world import World
+
+
+class BatchWorld(object):
+    # Choices of Character.play, in the same order
+    NOOP, MOVE, RESOLVE_EXISTING_CONFLICT, NEW_CONFRONTATION = range(4)
+    EVENT_TYPES = list(EventType)
+    EVENT_CODES = {event_type: code for code, event_type in enumerate(EVENT_TYPES)}
+    # Directions of World.move_character, in the same order, as (x, y) steps
+    DIRECTIONS = np.array([[0, 1], [0, -1], [-1, 0], [1, 0]], dtype=np.int64)
+    UP, DOWN, LEFT, RIGHT = range(4)
+    NO_CONFLICT = -1
+
+    # Advances one world per seed in lockstep. Every world draws from its own generator, so its story only depends on
+    # its seed, but the generators are NumPy ones: the stories follow the same rules as World, not the same draws.
+    def __init__(self, seeds, grid_size: int, character_size: int, iterations: int) -> None:
+        self.seeds = list(seeds)
+        self.grid_size = grid_size
+        self.character_size = character_size
+        self.iterations = iterations
+
+        self.generators = None
+        self.positions = None
+        self.initial_positions = None
+        self.conflicts = None
+        self.conflict_story_arcs = None
+        self.event_types = None
+        self.event_protagonists = None
+        self.event_antagonists = None
+        self.event_story_arcs = None
+        self.event_old_positions = None
+        self.event_new_positions = None
+        self.run_at = None
+
+    def build(self):
+        self.generators = [np.random.default_rng(seed) for seed in self.seeds]
+        self.positions = np.array([generator.integers(0, self.grid_size, size=(self.character_size, 2))
+                                   for generator in self.generators], dtype=np.int64)
+        self.initial_positions = self.positions.copy()
+
+        # conflicts[w, p, a] holds the id of the event that opened the conflict of p against a in world w, so
+        # sorting by it gives the order of Character.open_conflicts
+        worlds = len(self.seeds)
+        self.conflicts = np.full((worlds, self.character_size, self.character_size), self.NO_CONFLICT, dtype=np.int64)
+        self.conflict_story_arcs = np.zeros((worlds, self.character_size, self.character_size), dtype=bool)
+
+        events = self.iterations * self.character_size
+        self.event_types = np.zeros((events, worlds), dtype=np.int8)
+        self.event_protagonists = np.zeros((events, worlds), dtype=np.int32)
+        self.event_antagonists = np.full((events, worlds), -1, dtype=np.int32)
+        self.event_story_arcs = np.zeros((events, worlds), dtype=bool)
+        self.event_old_positions = np.zeros((events, worlds, 2), dtype=np.int32)
+        self.event_new_positions = np.zeros((events, worlds, 2), dtype=np.int32)
+
+    def run(self):
+        self.run_at = datetime.now()
+        event_id = 0
+
+        for iteration in range(0, self.iterations):
+            # One block per world and iteration: the shuffle key and the four draws a turn may need
+            draws = np.array([generator.random((self.character_size, 5)) for generator in self.generators])
+            turns = np.argsort(draws[:, :, 0], axis=1, kind='stable')
+
+            for turn in range(0, self.character_size):
+                self._play(event_id, turns[:, turn], draws[:, turn, 1:])
+                event_id += 1
+
+    def _play(self, event_id, protagonists, draws):
+        worlds = np.arange(len(self.seeds))
+        protagonist_positions = self.positions[worlds, protagonists]
+        characters_around = (self.positions == protagonist_positions[:, None, :]).all(axis=2)
+        characters_around[worlds, protagonists] = False
+
+        conflicts = self.conflicts[worlds, protagonists]
+        open_conflicts = conflicts != self.NO_CONFLICT
+        choices = (draws[:, 0] * 4).astype(np.int64)
+        directions = (draws[:, 1] * 4).astype(np.int64)
+
+        event_types = np.full(len(worlds), self.EVENT_CODES[EventType.NOOP], dtype=np.int8)
+        antagonists = np.full(len(worlds), -1, dtype=np.int64)
+        story_arcs = np.zeros(len(worlds), dtype=bool)
+        moving = choices == self.MOVE
+
+        # Resolve the first open conflict whose antagonist is around, or chase the closest antagonist
+        resolving = choices == self.RESOLVE_EXISTING_CONFLICT
+        resolvable = open_conflicts & characters_around
+        resolve_keys = np.where(resolvable, conflicts, np.iinfo(np.int64).max)
+        resolved = resolving & resolvable.any(axis=1)
+        resolved_antagonists = resolve_keys.argmin(axis=1)
+
+        chasing = resolving & open_conflicts.any(axis=1) & ~resolved
+        x_movs = World.get_wrapped_delta(protagonist_positions[:, 0:1], self.positions[:, :, 0], self.grid_size)
+        y_movs = World.get_wrapped_delta(protagonist_positions[:, 1:2], self.positions[:, :, 1], self.grid_size)
+        # Ties keep the order of the open conflicts, as World does
+        chase_keys = np.where(open_conflicts, (x_movs ** 2 + y_movs ** 2) * (event_id + 1) + conflicts,
+                              np.iinfo(np.int64).max)
+        chased_antagonists = chase_keys.argmin(axis=1)
+        x_mov = x_movs[worlds, chased_antagonists]
+        y_mov = y_movs[worlds, chased_antagonists]
+        chase_directions = np.where(np.abs(x_mov) > np.abs(y_mov), np.where(x_mov < 0, self.LEFT, self.RIGHT),
+                                    np.where(y_mov > 0, self.UP, self.DOWN))
+
+        # Confront someone around without an open conflict, or move when there is nobody
+        confronting = choices == self.NEW_CONFRONTATION
+        candidates = characters_around & ~open_conflicts
+        candidate_counts = candidates.sum(axis=1)
+        confronted = confronting & (candidate_counts > 0)
+        moving |= confronting & (candidate_counts == 0)
+        picks = (draws[:, 2] * candidate_counts).astype(np.int64)
+        confronted_antagonists = (candidates & (np.cumsum(candidates, axis=1) == (picks + 1)[:, None])).argmax(axis=1)
+        has_open_story_arcs = (open_conflicts & self.conflict_story_arcs[worlds, protagonists]).any(axis=1)
+        confront_story_arcs = ~has_open_story_arcs & (draws[:, 3] < 0.5)
+
+        event_types[moving] = self.EVENT_CODES[EventType.MOVE]
+        event_types[resolved] = self.EVENT_CODES[EventType.RESOLVE]
+        event_types[chasing] = self.EVENT_CODES[EventType.CHASE_RESOLUTION]
+        event_types[confronted] = self.EVENT_CODES[EventType.CONFRONT]
+        antagonists[resolved] = resolved_antagonists[resolved]
+        antagonists[chasing] = chased_antagonists[chasing]
+        antagonists[confronted] = confronted_antagonists[confronted]
+        has_antagonist = antagonists >= 0
+        story_arcs[has_antagonist] = self.conflict_story_arcs[worlds, protagonists, antagonists][has_antagonist]
+        story_arcs[confronted] = confront_story_arcs[confronted]
+
+        self.conflicts[worlds[resolved], protagonists[resolved], antagonists[resolved]] = self.NO_CONFLICT
+        self.conflicts[worlds[confronted], protagonists[confronted], antagonists[confronted]] = event_id
+        self.conflict_story_arcs[worlds[confronted], protagonists[confronted], antagonists[confronted]] = \
+            confront_story_arcs[confronted]
+
+        directions = np.where(chasing, chase_directions, directions)
+        movers = moving | chasing
+        new_positions = protagonist_positions.copy()
+        new_positions[movers] = (protagonist_positions[movers] + self.DIRECTIONS[directions[movers]]) % self.grid_size
+        self.positions[worlds, protagonists] = new_positions
+
+        self.event_types[event_id] = event_types
+        self.event_protagonists[event_id] = protagonists
+        self.event_antagonists[event_id] = antagonists
+        self.event_story_arcs[event_id] = story_arcs
+        self.event_old_positions[event_id] = protagonist_positions
+        self.event_new_positions[event_id] = new_positions
+
+    def get_world_dictionary(self, index, show_labels=False):
+        names = [f'c{character}' for character in range(self.character_size)]
+        backstory = BackStory()
+        character_events = OrderedDict((name, BackStory(backstory.event_store, name)) for name in names)
+
+        # Columns are turned into lists once, indexing NumPy arrays element by element is much slower
+        columns = zip(self.event_types[:, index].tolist(), self.event_protagonists[:, index].tolist(),
+                      self.event_antagonists[:, index].tolist(), self.event_story_arcs[:, index].tolist(),
+                      self.event_old_positions[:, index].tolist(), self.event_new_positions[:, index].tolist())
+        for event_id, (event_code, protagonist, antagonist, is_story_arc, old_position, new_position) in \
+                enumerate(columns):
+            event_type = self.EVENT_TYPES[event_code]
+            places = []
+            if event_type in (EventType.MOVE, EventType.CHASE_RESOLUTION):
+                places = [self._get_place_name(old_position), self._get_place_name(new_position)]
+
+            event = Event(event_id // self.character_size, event_id, is_story_arc, event_type.value,
+                          [names[protagonist]], [names[antagonist]] if antagonist >= 0 else [], [], [], places)
+            backstory.add_event(event)
+
+        initial_positions = OrderedDict()
+        cells = self.initial_positions[index, :, 0] * self.grid_size + self.initial_positions[index, :, 1]
+        for character in np.lexsort((np.arange(self.character_size), cells)).tolist():
+            initial_positions[names[character]] = self._get_place_name(self.initial_positions[index, character])
+
+        return World.build_world_dictionary(self.seeds[index], self.grid_size, self.character_size, self.iterations,
+                                            self.run_at, initial_positions, backstory, character_events,
+                                            show_labels)
+
+    @staticmethod
+    def _get_place_name(position):
+        return f'{position[0]}, {position[1]}'
+
+    def store_events_as_json(self, index, show_labels=False, output_file=None):
+        content = json.dumps(self.get_world_dictionary(index, show_labels), indent=2)
+
+        if output_file:
+            with open(output_file, 'w') as handler:
+                handler.write(content)
+        else:
+            print(content)
+
+
+def summarize_world(world_dictionary):
+    global_events = world_dictionary['EVENTS']['GLOBAL']
+    actions = [event['action'] for event in global_events]
+    confronts = [event for event in global_events if event['action'] == EventType.CONFRONT.value]
+    return OrderedDict([
+        ('actions', OrderedDict((event_type.value, actions.count(event_type.value)) for event_type in EventType)),
+        ('story_arc_confronts', sum(1 for event in confronts if event['is_story_arc'])),
+        ('plain_confronts', sum(1 for event in confronts if not event['is_story_arc'])),
+        ('occupied_places', len(set(world_dictionary['INITIAL_POSITIONS'].values())))])
+
+
+def compare_with_world(samples=500, grid_size=3, character_size=6, iterations=15, seed=0, alpha=0.01):
+    start = time.time()
+    reference_summaries = []
+    for world_seed in range(seed, seed + samples):
+        world = World(Random(world_seed), grid_size, character_size, iterations)
+        world.build()
+        world.run()
+        reference_summaries.append(summarize_world(json.loads(world.build_events_content(world_seed,
+                                                                                         show_labels=True))))
+    reference_time = time.time() - start
+
+    start = time.time()
+    batch = BatchWorld(range(seed, seed + samples), grid_size, character_size, iterations)
+    batch.build()
+    batch.run()
+    batch_summaries = [summarize_world(batch.get_world_dictionary(index, show_labels=True))
+                       for index in range(samples)]
+    batch_time = time.time() - start
+
+    # Pooled action frequencies and story-arc ratios are compared with chi-square tests, the per-world counts
+    # with two-sample Kolmogorov-Smirnov tests
+    results = OrderedDict()
+    action_names = [event_type.value for event_type in EventType]
+    contingency = [[sum(summary['actions'][name] for summary in summaries) for name in action_names]
+                   for summaries in (reference_summaries, batch_summaries)]
+    results['actions'] = stats.chi2_contingency(contingency)[1]
+    contingency = [[sum(summary[key] for summary in summaries) for key in ('story_arc_confronts', 'plain_confronts')]
+                   for summaries in (reference_summaries, batch_summaries)]
+    results['story_arcs'] = stats.chi2_contingency(contingency)[1]
+    for name in action_names:
+        results[f'{name}_per_world'] = stats.ks_2samp([summary['actions'][name] for summary in reference_summaries],
+                                                      [summary['actions'][name] for summary in batch_summaries])[1]
+    results['occupied_places'] = stats.ks_2samp([summary['occupied_places'] for summary in reference_summaries],
+                                                [summary['occupied_places'] for summary in batch_summaries])[1]
+
+    print(f'World: {reference_time:.2f}s, BatchWorld: {batch_time:.2f}s for {samples} worlds')
+    for name, p_value in results.items():
+        print(f'- {name}: p={p_value:.4f}')
+
+    different = [name for name, p_value in results.items() if p_value < alpha]
+    if different:
+        raise Exception(f'BatchWorld differs from World in {different} (p < {alpha})')
+    return results
+
+
+if __name__ == '__main__':
+    compare_with_world()
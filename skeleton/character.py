@@ -11,9 +11,13 @@ class Character(object):
         self.id = id
         self.random = random
         self.name = f'c{self.id}'
-        self.backstory = BackStory()
+        self.backstory = BackStory(world.backstory.event_store, self.name)
         self.open_conflicts: List[Conflict] = []
 
+    def __hash__(self):
+        # Sets of characters drive random choices, so their order must not depend on memory addresses
+        return self.id
+
     def play(self, t, event_id):
         actions = [self._no_operation, self._move_randomly, self._try_resolve_existing_conflict,
                    self._try_new_confrontation]
@@ -28,7 +32,6 @@ class Character(object):
 
     def _no_operation(self, t, event_id, *args, **kwargs):
         event = Event(t, event_id, False, EventType.NOOP.value, [self.name], [], [], [], [])
-        self.backstory.add_event(event)
         self.world.add_world_event(event)
 
     def _move_randomly(self, t, event_id, *args, **kwargs):
@@ -37,7 +40,6 @@ class Character(object):
         new_position = self.world.get_position(self)
 
         event = Event(t, event_id, False, EventType.MOVE.value, [self.name], [], [], [], [old_position, new_position])
-        self.backstory.add_event(event)
         self.world.add_world_event(event)
 
     def _try_resolve_existing_conflict(self, t, event_id, characters_around):
@@ -58,8 +60,6 @@ class Character(object):
         event = Event(t, event_id, conflict.is_story_arc, EventType.RESOLVE.value, [self.name],
                       [conflict.antagonist.name],
                       [], [], [])
-        conflict.antagonist.add_event(event)
-        self.backstory.add_event(event)
         self.world.add_world_event(event)
 
     def _chase_conflict_resolution(self, t, event_id):
@@ -73,8 +73,6 @@ class Character(object):
                                    if conflict.antagonist == closer_antagonist)
         event = Event(t, event_id, conflict_to_resolve.is_story_arc, EventType.CHASE_RESOLUTION.value, [self.name],
                       [closer_antagonist.name], [], [], [old_position, new_position])
-        closer_antagonist.add_event(event)
-        self.backstory.add_event(event)
         self.world.add_world_event(event)
 
     def _try_new_confrontation(self, t, event_id, characters_around):
@@ -97,9 +95,4 @@ class Character(object):
         self.open_conflicts.append(conflict)
 
         event = Event(t, event_id, is_story_arc, EventType.CONFRONT.value, [self.name], [antagonist.name], [], [], [])
-        antagonist.add_event(event)
-        self.backstory.add_event(event)
         self.world.add_world_event(event)
-
-    def add_event(self, event):
-        self.backstory.add_event(event)
@@ -1,16 +1,18 @@
-import copy
 import itertools
 import json
-import math
 from collections import OrderedDict
 from datetime import datetime
 from random import Random
 
+import numpy as np
+
 from skeleton.backstory import BackStory
 from skeleton.character import Character
 
 
 class World(object):
+    VECTORIZED_ANTAGONISTS = 16
+
     def __init__(self, random: Random, grid_size: int, character_size: int, iterations: int) -> None:
         self.random = random
         self.grid_size = grid_size
@@ -18,6 +20,7 @@ class World(object):
         self.iterations = iterations
 
         self.positions = None
+        self.character_positions = None
         self.initial_positions = None
         self.characters = None
         self.backstory = None
@@ -34,6 +37,8 @@ class World(object):
                 row.append(position)
             self.positions.append(row)
 
+        # Every cell keeps its occupants and every character its cell, so lookups never scan the grid
+        self.character_positions = {}
         self.characters = []
         for c in range(0, self.character_size):
             character = Character(self, c, self.random)
@@ -43,8 +48,10 @@ class World(object):
             random_y = self.random.randint(0, self.grid_size - 1)
             random_position = self.positions[random_x][random_y]
             random_position.add(character)
+            self.character_positions[character] = (random_x, random_y)
 
-        self.initial_positions = copy.deepcopy(self.positions)
+        # Only the occupants are needed later, copying the characters themselves would copy the whole world
+        self.initial_positions = [[set(position) for position in row] for row in self.positions]
 
     def run(self):
         self.run_at = datetime.now()
@@ -61,23 +68,22 @@ class World(object):
             t += 1
 
     def add_world_event(self, event):
+        # Stored once, the backstories of its protagonist and antagonist only keep its row
         self.backstory.add_event(event)
 
     def get_position(self, character):
-        for y in range(0, self.grid_size):
-            for x in range(0, self.grid_size):
-                if character in self.positions[x][y]:
-                    return f'{x}, {y}'
+        if character not in self.character_positions:
+            return 'Unknown'
 
-        return 'Unknown'
+        x, y = self.character_positions[character]
+        return f'{x}, {y}'
 
     def get_characters_around(self, character):
-        for y in range(0, self.grid_size):
-            for x in range(0, self.grid_size):
-                if character in self.positions[x][y]:
-                    return self.positions[x][y].difference({character})
+        if character not in self.character_positions:
+            return set()
 
-        return set()
+        x, y = self.character_positions[character]
+        return self.positions[x][y].difference({character})
 
     def get_events(self, show_labels):
         return self.backstory.get_events_as_dictionary(show_labels)
@@ -115,76 +121,90 @@ class World(object):
         self._move_handler(character, calculator)
 
     def _move_handler(self, character, new_position_calculator):
-        for y in range(0, self.grid_size):
-            for x in range(0, self.grid_size):
-                if character in self.positions[x][y]:
-                    self.positions[x][y].remove(character)
-                    new_x, new_y = new_position_calculator(self, x, y)
-                    self.positions[new_x][new_y].add(character)
-                    return
+        if character not in self.character_positions:
+            return
+
+        x, y = self.character_positions[character]
+        self.positions[x][y].remove(character)
+        new_x, new_y = new_position_calculator(self, x, y)
+        self.positions[new_x][new_y].add(character)
+        self.character_positions[character] = (new_x, new_y)
 
     def get_closer_antagonist(self, character, antagonists):
         if not antagonists:
             return None, None
 
-        characters_map = {character: None for character in [character] + antagonists}
-        for y in range(0, self.grid_size):
-            for x in range(0, self.grid_size):
-                candidates_not_found = [key for key in characters_map.keys() if characters_map[key] is None]
-                for candidate in candidates_not_found:
-                    if candidate in self.positions[x][y]:
-                        characters_map[candidate] = (x, y)
-
-        x1, y1 = characters_map[character]
-        del characters_map[character]
-
-        min_distance = float('inf')
-        min_x_mov = None
-        min_y_mov = None
-        min_candidate = None
-
-        for candidate, position in characters_map.items():
-            x, y = position
-            for y_diff in [-self.grid_size, 0, self.grid_size]:
-                for x_diff in [-self.grid_size, 0, self.grid_size]:
-                    x2 = x + x_diff
-                    y2 = y + y_diff
-                    distance = self.calculate_distance(x1, y1, x2, y2)
-                    if distance < min_distance:
-                        min_x_mov = x2 - x1
-                        min_y_mov = y2 - y1
-                        min_candidate = candidate
-
-        option_y = 'up' if min_y_mov < 0 else 'down'
-        option_x = 'left' if min_x_mov < 0 else 'right'
-        option = option_x if abs(min_x_mov) > abs(min_y_mov) else option_y
-
-        return min_candidate, option
-
-    def calculate_distance(self, x1, y1, x2, y2):
-        return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
+        x, y = self.character_positions[character]
+        positions = [self.character_positions[antagonist] for antagonist in antagonists]
+        if len(positions) >= self.VECTORIZED_ANTAGONISTS:
+            closer_index, x_mov, y_mov = self._get_closer_position_vectorized(x, y, positions)
+        else:
+            closer_index, x_mov, y_mov = self._get_closer_position(x, y, positions)
+
+        # Moving up increases y, so it is the way to go when the antagonist is above
+        option_y = 'up' if y_mov > 0 else 'down'
+        option_x = 'left' if x_mov < 0 else 'right'
+        option = option_x if abs(x_mov) > abs(y_mov) else option_y
+
+        return antagonists[closer_index], option
+
+    @staticmethod
+    def get_wrapped_delta(origin, target, grid_size):
+        # Shortest signed offset on the torus, in [-grid_size // 2, grid_size // 2), for ints or NumPy arrays
+        half_grid_size = grid_size // 2
+        return (target - origin + half_grid_size) % grid_size - half_grid_size
+
+    def _get_closer_position(self, x, y, positions):
+        closer = None
+        for index, (antagonist_x, antagonist_y) in enumerate(positions):
+            x_mov = self.get_wrapped_delta(x, antagonist_x, self.grid_size)
+            y_mov = self.get_wrapped_delta(y, antagonist_y, self.grid_size)
+            squared_distance = x_mov * x_mov + y_mov * y_mov
+            if closer is None or squared_distance < closer[0]:
+                closer = (squared_distance, index, x_mov, y_mov)
+
+        return closer[1:]
+
+    def _get_closer_position_vectorized(self, x, y, positions):
+        positions = np.array(positions, dtype=np.int64)
+        x_movs = self.get_wrapped_delta(x, positions[:, 0], self.grid_size)
+        y_movs = self.get_wrapped_delta(y, positions[:, 1], self.grid_size)
+        closer_index = int(np.argmin(x_movs * x_movs + y_movs * y_movs))
+        return closer_index, int(x_movs[closer_index]), int(y_movs[closer_index])
 
     def store_events_as_json(self, seed, show_labels=False, output_file=None):
-        world_dictionary = OrderedDict()
-        world_dictionary['META'] = OrderedDict([
-            ('SEED', seed), ('GRID_SIZE', self.grid_size), ('CHARACTER_SIZE', self.character_size),
-            ('ITERATIONS', self.iterations), ('RUN_AT', self.run_at.isoformat())])
-        world_dictionary['CHARACTERS'] = [character.name for character in self.characters]
-        world_dictionary['PLACES'] = []
-        world_dictionary['INITIAL_POSITIONS'] = OrderedDict()
-        for x, y in itertools.product(range(self.grid_size), range(self.grid_size)):
-            place_name = f'{x}, {y}'
-            world_dictionary['PLACES'].append(place_name)
-            for character in self.initial_positions[x][y]:
-                world_dictionary['INITIAL_POSITIONS'][character.name] = place_name
-        world_dictionary['EVENTS'] = OrderedDict()
-        world_dictionary['EVENTS']['GLOBAL'] = self.backstory.get_events_as_dictionary(show_labels)
-        for character in self.characters:
-            world_dictionary['EVENTS'][character.name] = character.backstory.get_events_as_dictionary(show_labels)
-        content = json.dumps(world_dictionary, indent=2)
+        content = self.build_events_content(seed, show_labels)
 
         if output_file:
             with open(output_file, 'w') as handler:
                 handler.write(content)
         else:
             print(content)
+
+    def build_events_content(self, seed, show_labels=False):
+        initial_positions = OrderedDict()
+        for x, y in itertools.product(range(self.grid_size), range(self.grid_size)):
+            for character in self.initial_positions[x][y]:
+                initial_positions[character.name] = f'{x}, {y}'
+        character_events = OrderedDict((character.name, character.backstory) for character in self.characters)
+
+        world_dictionary = self.build_world_dictionary(seed, self.grid_size, self.character_size, self.iterations,
+                                                       self.run_at, initial_positions, self.backstory,
+                                                       character_events, show_labels)
+        return json.dumps(world_dictionary, indent=2)
+
+    @staticmethod
+    def build_world_dictionary(seed, grid_size, character_size, iterations, run_at, initial_positions, backstory,
+                               character_events, show_labels=False):
+        world_dictionary = OrderedDict()
+        world_dictionary['META'] = OrderedDict([
+            ('SEED', seed), ('GRID_SIZE', grid_size), ('CHARACTER_SIZE', character_size),
+            ('ITERATIONS', iterations), ('RUN_AT', run_at.isoformat())])
+        world_dictionary['CHARACTERS'] = list(character_events.keys())
+        world_dictionary['PLACES'] = [f'{x}, {y}' for x, y in itertools.product(range(grid_size), range(grid_size))]
+        world_dictionary['INITIAL_POSITIONS'] = initial_positions
+        world_dictionary['EVENTS'] = OrderedDict()
+        world_dictionary['EVENTS']['GLOBAL'] = backstory.get_events_as_dictionary(show_labels)
+        for character_name, character_backstory in character_events.items():
+            world_dictionary['EVENTS'][character_name] = character_backstory.get_events_as_dictionary(show_labels)
+        return world_dictionary
@@ -2,7 +2,8 @@ import itertools
 import json
 from collections import OrderedDict
 
-from common.event import Event, EventType
+from common.event import EventType
+from common.event_store import EventStore
 from common.utils import uncamel
 from storyteller.random_word_generator import RandomWordGenerator
 from storyteller.sentence_picker import SentencePicker
@@ -16,7 +17,6 @@ class ForgetfulStoryTeller(object):
         self.global_events = []
         self.grid_size = 0
         self.character_events = OrderedDict()
-        self.events_by_id = OrderedDict()
 
         self.places = []
         self.places_index = {}
@@ -47,17 +47,7 @@ class ForgetfulStoryTeller(object):
         for character in log['CHARACTERS']:
             self.characters.append(character)
 
-        for event_dictionary in log['EVENTS']['GLOBAL']:
-            event = Event(**event_dictionary)
-            self.global_events.append(event)
-            self.events_by_id[event.id] = event
-
-        for character in self.characters:
-            self.character_events[character] = []
-            for event_dictionary in log['EVENTS'][character]:
-                id = event_dictionary['id']
-                event = self.events_by_id[id]
-                self.character_events[character].append(event)
+        self.global_events, self.character_events = EventStore.from_log(log, self.characters)
 
         self.story_introduction_sentence_picker = SentencePicker(
             self.random, 'sentence_templates/story_introduction.txt')
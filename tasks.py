@@ -7,11 +7,12 @@ from invoke import task
 
 from representation.skeleton_representer import SkeletonPresenter
 from scraper.characters_by_film_builder import CharactersByFilmBuilder
+from skeleton.batch_skeleton_builder import BatchSkeletonBuilder
 from skeleton.world import World
 from scraper.tropes_resource_builder import TropesResourceBuilder
 from storyteller.forgetful_story_teller import ForgetfulStoryTeller
 from trope_selector.evaluators.association_rules_evaluator_builder import AssociationRulesBuilder
-from trope_selector.trope_selector import TropeSelector
+from trope_selector.trope_selector import TropeSelector, compare_with_resumed_run
 
 
 @task
@@ -26,6 +27,14 @@ def build_skeleton(context, seed=None, grid_size=2, characters=5, iterations=10,
     world.store_events_as_json(seed, show_labels, output_file)
 
 
+@task
+def build_skeletons(context, output_prefix, seed_range=None, seed_file=None, grid_size=2, characters=5, iterations=10,
+                    show_labels=False, shard_size=1000, workers=None):
+    seeds = BatchSkeletonBuilder.read_seeds(seed_range, seed_file)
+    builder = BatchSkeletonBuilder(seeds, grid_size, characters, iterations, output_prefix, show_labels,
+                                   int(shard_size), int(workers) if workers else None)
+    builder.run()
+
 @task
 def build_tropes_resource(context, recursion_level=2, output_file=None):
     builder = TropesResourceBuilder(recursion_level)
@@ -62,7 +71,13 @@ def make_up_random_story(context, world_resource, tropes_resource, seed=None, ex
 
 @task
 def make_up_best_story(context, world_resource, tropes_resource, neural_network_file, seed=None,
-                       extended_dataset_resource=None, output_solution_file=None):
+                       extended_dataset_resource=None, output_solution_file=None, rating_cache_size=100000,
+                       rating_cache_policy='lru', rating_cache_file=None, workers=1, chunk_size=None, engine='deap',
+                       population_size=300, islands=1, migration_interval=10, migration_size=5,
+                       checkpoint_file=None, checkpoint_interval=10, resume_from=None, max_generations=100,
+                       max_evaluations=None, max_wall_time=None, patience=None, telemetry_file=None,
+                       surrogate_fraction=None, surrogate_exploration=0.1, surrogate_refit_interval=5,
+                       incremental_evaluation=False, use_forward_engine=True, forward_engine_dtype='float32'):
     seed = int(time.time() * 1000000) if seed is None else int(seed)
     random = Random(x=seed)
     print(f'Seed: {seed}', file=stderr)
@@ -73,7 +88,24 @@ def make_up_best_story(context, world_resource, tropes_resource, neural_network_
     selector = TropeSelector(random, world_resource, tropes_resource, general_seed, extended_dataset_resource,
                              neural_network_file, output_solution_file)
     selector.prepare()
-    tropes = selector.select_best_tropes()
+    tropes = selector.select_best_tropes(rating_cache_size=int(rating_cache_size),
+                                         rating_cache_policy=rating_cache_policy, rating_cache_file=rating_cache_file,
+                                         workers=int(workers), chunk_size=int(chunk_size) if chunk_size else None,
+                                         engine=engine, population_size=int(population_size),
+                                         islands=int(islands), migration_interval=int(migration_interval),
+                                         migration_size=int(migration_size), checkpoint_file=checkpoint_file,
+                                         checkpoint_interval=int(checkpoint_interval), resume_from=resume_from,
+                                         max_generations=int(max_generations),
+                                         max_evaluations=int(max_evaluations) if max_evaluations else None,
+                                         max_wall_time=float(max_wall_time) if max_wall_time else None,
+                                         patience=int(patience) if patience else None,
+                                         telemetry_file=telemetry_file,
+                                         surrogate_fraction=float(surrogate_fraction) if surrogate_fraction else None,
+                                         surrogate_exploration=float(surrogate_exploration),
+                                         surrogate_refit_interval=int(surrogate_refit_interval),
+                                         incremental_evaluation=incremental_evaluation,
+                                         use_forward_engine=use_forward_engine,
+                                         forward_engine_dtype=forward_engine_dtype)
     selector.close()
 
     teller = ForgetfulStoryTeller(random, world_resource)
@@ -81,13 +113,29 @@ def make_up_best_story(context, world_resource, tropes_resource, neural_network_
     story = teller.tell_story(tropes)
     print(story)
 
+@task
+def compare_resumed_run(context, world_resource, tropes_resource, neural_network_file, seed=0, checkpoint_generation=10,
+                        max_generations=100, max_evaluations=None, workers=1, incremental_evaluation=False):
+    compare_with_resumed_run(world_resource, tropes_resource, neural_network_file, seed=int(seed),
+                             checkpoint_generation=int(checkpoint_generation), max_generations=int(max_generations),
+                             max_evaluations=int(max_evaluations) if max_evaluations else None, workers=int(workers),
+                             incremental_evaluation=incremental_evaluation)
+
 @task
 def present_skeleton(context, world_resource, output_prefix, solution_resource=None):
     presenter = SkeletonPresenter(world_resource, output_prefix, solution_resource)
     presenter.present()
 
 @task
-def build_association_rules(context, seed, extended_dataset_resource, output_prefix):
+def build_association_rules(context, seed, extended_dataset_resource, output_prefix, min_supports=None,
+                            min_thresholds=None, workers=None):
     builder = AssociationRulesBuilder(extended_dataset_resource, output_prefix)
     builder.prepare()
-    builder.build_rules()
\ No newline at end of file
+    if min_supports is None and min_thresholds is None:
+        builder.build_rules()
+        return
+
+    min_supports = [float(value) for value in min_supports.split(',')] if min_supports else [builder.min_support]
+    min_thresholds = [float(value) for value in min_thresholds.split(',')] if min_thresholds \
+        else [builder.min_threshold]
+    builder.build_rules_sweep(min_supports, min_thresholds, int(workers) if workers else None)
\ No newline at end of file
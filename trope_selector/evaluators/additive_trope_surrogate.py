@@ -0,0 +1,64 @@
+from collections import deque
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+class AdditiveTropeSurrogate(object):
+    # Approximates the fitness of a genome as an intercept plus one weight per trope, scaled by the share of rated
+    # trope sets that contain the trope. It is fitted with ridge regression on the genomes rated so far.
+    def __init__(self, tropes, regularization=1.0, max_samples=10000):
+        self.tropes = tropes
+        self.trope_ids = {trope: trope_id for trope_id, trope in enumerate(tropes)}
+        self.regularization = regularization
+        self.samples = deque(maxlen=max_samples)
+        self.weights = None
+        self.intercept = 0.0
+
+    def is_fitted(self):
+        return self.weights is not None
+
+    def build_features(self, lists_of_trope_sets):
+        # Genomes only have a few tropes each, so the features are kept as sparse rows
+        rows = []
+        columns = []
+        for row, trope_sets in enumerate(lists_of_trope_sets):
+            for trope_set in trope_sets:
+                for trope in trope_set:
+                    trope_id = self.trope_ids.get(trope)
+                    if trope_id is not None:
+                        rows.append(row)
+                        columns.append(trope_id)
+
+        set_counts = np.array([max(len(trope_sets), 1) for trope_sets in lists_of_trope_sets], dtype=np.float32)
+        values = 1 / set_counts[np.array(rows, dtype=np.int64)]
+        return csr_matrix((values, (rows, columns)), shape=(len(lists_of_trope_sets), len(self.tropes)),
+                          dtype=np.float32)
+
+    def add_samples(self, lists_of_trope_sets, fitnesses):
+        features = self.build_features(lists_of_trope_sets)
+        for row, fitness in enumerate(fitnesses):
+            start, end = features.indptr[row], features.indptr[row + 1]
+            self.samples.append((features.indices[start:end], features.data[start:end], fitness))
+
+    def fit(self):
+        if not self.samples:
+            return
+
+        row_lengths = [len(sample[0]) for sample in self.samples]
+        indptr = np.concatenate(([0], np.cumsum(row_lengths)))
+        features = csr_matrix((np.concatenate([sample[1] for sample in self.samples]).astype(np.float64),
+                               np.concatenate([sample[0] for sample in self.samples]), indptr),
+                              shape=(len(self.samples), len(self.tropes)))
+        fitnesses = np.array([sample[2] for sample in self.samples], dtype=np.float64)
+        features_mean = np.asarray(features.mean(axis=0)).ravel()
+        fitnesses_mean = fitnesses.mean()
+
+        # Centred Gram matrix without centring the features, which would make them dense
+        gram = (features.T @ features).toarray() - len(self.samples) * np.outer(features_mean, features_mean)
+        gram += self.regularization * np.eye(len(self.tropes))
+        self.weights = np.linalg.solve(gram, features.T @ (fitnesses - fitnesses_mean))
+        self.intercept = fitnesses_mean - features_mean @ self.weights
+
+    def predict(self, lists_of_trope_sets):
+        return self.build_features(lists_of_trope_sets) @ self.weights + self.intercept
@@ -1,3 +1,4 @@
+import ast
 import bz2
 import csv
 import gc
@@ -5,6 +6,8 @@ import os
 import pickle
 from typing import NamedTuple, Set
 
+from trope_selector.evaluators.indexed_association_rules import IndexedAssociationRules
+
 AssociationRule = NamedTuple('AssociationRule', [('antecedents', Set), ('consequents', Set), ('confidence', float)])
 
 
@@ -12,10 +15,16 @@ class AssociationRulesEvaluator(object):
     def __init__(self, association_rules_resource):
         self.association_rules_resource = association_rules_resource
         self.pickle_file = f'{self.association_rules_resource}.plk'
-        self.trope_rules = {}
+        self.store_directory = f'{self.association_rules_resource}.rules'
         self.rules = []
+        self.indexed_rules = None
 
     def prepare(self):
+        if os.path.isdir(self.store_directory):
+            self.indexed_rules = IndexedAssociationRules.load(self.store_directory)
+            print(f'rules loaded: {len(self.indexed_rules)}')
+            return
+
         if os.path.exists(self.pickle_file):
             with open(self.pickle_file, 'rb') as handler:
                 try:
@@ -24,54 +33,35 @@ class AssociationRulesEvaluator(object):
                 finally:
                     gc.enable()
         else:
-            with bz2.open(self.association_rules_resource) as handler:
-                binary_content = handler.read()
-            content = binary_content.decode()
-            lines = content.split('\n')
-            reader = csv.reader(lines)
-            header = next(reader)
-            for index, row in enumerate(reader):
-                if not row:
-                    continue
-                if index % 100000 == 0:
-                    print(f'rows processed: {index}')
-
-                antecedents = eval(row[0])
-                consequents = eval(row[1])
-                confidence = eval(row[5])
-
-                rule = AssociationRule(antecedents, consequents, confidence)
-                self.rules.append(rule)
-
-            with open(self.pickle_file, 'wb') as handler:
-                pickle.dump(self.rules, handler, protocol=pickle.HIGHEST_PROTOCOL)
-
-        for index, rule in enumerate(self.rules):
-            if index % 100000 == 0:
-                print(f'rules indexed: {index}')
+            with bz2.open(self.association_rules_resource, 'rt') as handler:
+                reader = csv.reader(handler)
+                header = next(reader)
+                for index, row in enumerate(reader):
+                    if not row:
+                        continue
+                    if index % 100000 == 0:
+                        print(f'rows processed: {index}')
+
+                    antecedents = self._parse_itemset(row[0])
+                    consequents = self._parse_itemset(row[1])
+                    confidence = float(row[5])
+
+                    rule = AssociationRule(antecedents, consequents, confidence)
+                    self.rules.append(rule)
+
+        print(f'indexing {len(self.rules)} rules')
+        self.indexed_rules = IndexedAssociationRules.build(self.rules)
+        self.indexed_rules.save(self.store_directory)
+        self.rules = []
 
-            for trope in rule.antecedents.union(rule.consequents):
-                if trope not in self.trope_rules:
-                    self.trope_rules[trope] = set()
-                self.trope_rules[trope].add(rule)
+    @staticmethod
+    def _parse_itemset(text):
+        # Itemsets are written by pandas as frozenset({'A', 'B'})
+        return set(ast.literal_eval(text[len('frozenset('):-1]))
 
     # @lru_cache(maxsize=None)
     def evaluate_just_rating(self, list_of_tropes: list):
-        candidate_rules = set()
-        for trope in list_of_tropes:
-            if trope in self.trope_rules:
-                candidate_rules = candidate_rules.union(self.trope_rules[trope])
-
-        confidences = []
-        for candidate_consequent in list_of_tropes:
-            confidence = 0
-            required_antecedents = set([trope for trope in list_of_tropes if trope != candidate_consequent])
-            for rule in candidate_rules:
-                if rule.antecedents.issubset(required_antecedents) and candidate_consequent in rule.consequents:
-                    confidence = max(confidence, rule.confidence)
-            confidences.append(confidence)
-
-        return sum(confidences)
+        return self.indexed_rules.evaluate_just_rating(list_of_tropes)
 
 
 def evaluate(evaluator, tropes):
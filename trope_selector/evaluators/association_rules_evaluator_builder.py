@@ -1,7 +1,17 @@
 import bz2
+import itertools
 import json
+import math
+import os
+import resource
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
-from mlxtend.frequent_patterns import association_rules
+import numpy as np
+import pandas as pd
+from mlxtend.frequent_patterns import association_rules, fpgrowth
+from scipy.sparse import csr_matrix
 
 
 class AssociationRulesBuilder(object):
@@ -17,25 +27,85 @@ class AssociationRulesBuilder(object):
             compressed_content = file.read()
         csv_content = bz2.decompress(compressed_content)
         self.extended_dataset = json.loads(csv_content)
+        self._print_peak_memory('loading the dataset')
 
     def build_rules(self):
-        baskets = [element['tropes'] for element in self.extended_dataset]
-        import pandas as pd
-        from mlxtend.preprocessing import TransactionEncoder
+        support_items = self._mine_frequent_itemsets(self.min_support)
+        build_rules_file(support_items, self.output_prefix, self.min_support, self.min_threshold)
+        self._print_peak_memory('building the rules')
 
-        te = TransactionEncoder()
-        te_ary = te.fit(baskets).transform(baskets)
-        df = pd.DataFrame(te_ary, columns=te.columns_)
+    def build_rules_sweep(self, min_supports, min_thresholds, workers=None):
+        lowest_min_support = min(min_supports)
+        file_parameters = f'[{lowest_min_support}]'.replace('.', '_')
+        itemsets_file = f'{self.output_prefix}_itemsets_{file_parameters}.pkl'
+        if os.path.exists(itemsets_file):
+            print(f'Frequent itemsets read from {itemsets_file}')
+        else:
+            support_items = self._mine_frequent_itemsets(lowest_min_support)
+            support_items.to_pickle(itemsets_file)
+            print(f'Frequent itemsets written to {itemsets_file}')
+            del support_items
 
-        from mlxtend.frequent_patterns import fpgrowth
+        parameters = list(itertools.product(sorted(set(min_supports)), sorted(set(min_thresholds))))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(build_rules_file_from_itemsets, itemsets_file, self.output_prefix, min_support,
+                                       min_threshold)
+                       for min_support, min_threshold in parameters]
+            for future in futures:
+                future.result()
+        self._print_peak_memory('building the rules')
 
-        support_items = fpgrowth(df, min_support=self.min_support, use_colnames=True)
-        rules = association_rules(support_items, metric='confidence', min_threshold=self.min_threshold,
-                                  support_only=False)
-        print(f'Rules shape: {rules.shape}')
+    def _mine_frequent_itemsets(self, min_support):
+        df = self._build_transactions(min_support)
+        self._print_peak_memory('encoding the transactions')
 
-        file_parameters = f'[{self.min_support}, {self.min_threshold}]'.replace('.', '_')
-        file_name = f'{self.output_prefix}_{file_parameters}.csv.bz2'
-        rules.to_csv(file_name, index = False, header=True, compression='bz2')
+        support_items = fpgrowth(df, min_support=min_support, use_colnames=True)
+        print(f'Frequent itemsets with support >= {min_support}: {len(support_items)}')
+        self._print_peak_memory('mining the frequent itemsets')
+        return support_items
 
-        print(f'Compressed JSON written to {file_name}')
+    def _build_transactions(self, min_support):
+        baskets = [set(element['tropes']) for element in self.extended_dataset]
+
+        # Tropes below the minimum support can not be part of any frequent itemset
+        trope_counts = Counter(trope for basket in baskets for trope in basket)
+        min_count = math.ceil(min_support * len(baskets))
+        columns = sorted(trope for trope, count in trope_counts.items() if count >= min_count)
+        column_indexes = {trope: index for index, trope in enumerate(columns)}
+        print(f'Tropes: {len(trope_counts)}, kept with support >= {min_support}: {len(columns)}')
+
+        indices = []
+        indptr = [0]
+        for basket in baskets:
+            indices.extend(sorted(column_indexes[trope] for trope in basket if trope in column_indexes))
+            indptr.append(len(indices))
+        data = np.ones(len(indices), dtype=bool)
+        matrix = csr_matrix((data, indices, indptr), shape=(len(baskets), len(columns)))
+
+        return pd.DataFrame.sparse.from_spmatrix(matrix, columns=columns)
+
+    @staticmethod
+    def _print_peak_memory(step):
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+        peak_memory_mb = peak_memory / (1024 * 1024) if sys.platform == 'darwin' else peak_memory / 1024
+        print(f'Peak memory after {step}: {peak_memory_mb:.1f} MB')
+
+
+def build_rules_file_from_itemsets(itemsets_file, output_prefix, min_support, min_threshold):
+    support_items = pd.read_pickle(itemsets_file)
+    # Frequent itemsets are closed under subsets, so filtering keeps every support the rules need
+    support_items = support_items[support_items['support'] >= min_support].reset_index(drop=True)
+    return build_rules_file(support_items, output_prefix, min_support, min_threshold)
+
+
+def build_rules_file(support_items, output_prefix, min_support, min_threshold):
+    rules = association_rules(support_items, metric='confidence', min_threshold=min_threshold, support_only=False)
+    print(f'Rules shape for [{min_support}, {min_threshold}]: {rules.shape}')
+
+    file_parameters = f'[{min_support}, {min_threshold}]'.replace('.', '_')
+    file_name = f'{output_prefix}_{file_parameters}.csv.bz2'
+    rules.to_csv(file_name, index = False, header=True, compression='bz2')
+
+    print(f'Compressed JSON written to {file_name}')
+    return file_name
@@ -0,0 +1,119 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+class IndexedAssociationRules(object):
+    TROPES_FILE = 'tropes.json'
+    ARRAYS = ['rule_antecedent_offsets', 'rule_antecedent_tropes', 'rule_consequent_offsets',
+              'rule_consequent_tropes', 'rule_confidences', 'consequent_offsets', 'entry_sizes', 'entry_confidences',
+              'entry_antecedent_offsets', 'entry_antecedent_tropes']
+
+    # Rules are stored as CSR arrays of antecedents and consequents. The index has one entry per (rule, consequent)
+    # pair; entries are grouped by consequent and, inside each group, sorted by antecedent size so only the rules
+    # whose antecedents can fit in the query are touched.
+    def __init__(self, tropes, rule_antecedent_offsets, rule_antecedent_tropes, rule_consequent_offsets,
+                 rule_consequent_tropes, rule_confidences, consequent_offsets, entry_sizes, entry_confidences,
+                 entry_antecedent_offsets, entry_antecedent_tropes):
+        self.tropes = tropes
+        self.trope_ids = {trope: trope_id for trope_id, trope in enumerate(tropes)}
+        self.rule_antecedent_offsets = rule_antecedent_offsets
+        self.rule_antecedent_tropes = rule_antecedent_tropes
+        self.rule_consequent_offsets = rule_consequent_offsets
+        self.rule_consequent_tropes = rule_consequent_tropes
+        self.rule_confidences = rule_confidences
+        self.consequent_offsets = consequent_offsets
+        self.entry_sizes = entry_sizes
+        self.entry_confidences = entry_confidences
+        self.entry_antecedent_offsets = entry_antecedent_offsets
+        self.entry_antecedent_tropes = entry_antecedent_tropes
+
+    @classmethod
+    def build(cls, rules):
+        tropes = sorted(set(trope for rule in rules for trope in rule.antecedents.union(rule.consequents)))
+        trope_ids = {trope: trope_id for trope_id, trope in enumerate(tropes)}
+
+        rule_antecedents = [sorted(trope_ids[trope] for trope in rule.antecedents) for rule in rules]
+        rule_consequents = [sorted(trope_ids[trope] for trope in rule.consequents) for rule in rules]
+        rule_confidences = np.array([rule.confidence for rule in rules], dtype=np.float64)
+
+        entries = []
+        for antecedents, consequents, rule in zip(rule_antecedents, rule_consequents, rules):
+            for consequent in consequents:
+                entries.append((consequent, len(antecedents), -rule.confidence, antecedents))
+        entries.sort(key=lambda entry: entry[:3])
+
+        consequent_counts = np.bincount([entry[0] for entry in entries], minlength=len(tropes))
+        consequent_offsets = cls._offsets(consequent_counts)
+        entry_sizes = np.array([entry[1] for entry in entries], dtype=np.int32)
+        entry_confidences = np.array([-entry[2] for entry in entries], dtype=np.float64)
+
+        return cls(tropes, cls._offsets([len(antecedents) for antecedents in rule_antecedents]),
+                   cls._flatten(rule_antecedents), cls._offsets([len(consequents) for consequents in rule_consequents]),
+                   cls._flatten(rule_consequents), rule_confidences, consequent_offsets, entry_sizes,
+                   entry_confidences, cls._offsets(entry_sizes), cls._flatten([entry[3] for entry in entries]))
+
+    @staticmethod
+    def _offsets(counts):
+        return np.concatenate(([0], np.cumsum(counts, dtype=np.int64))).astype(np.int64)
+
+    @staticmethod
+    def _flatten(lists_of_trope_ids):
+        return np.array([trope_id for trope_ids in lists_of_trope_ids for trope_id in trope_ids], dtype=np.int32)
+
+    def save(self, directory):
+        parent_directory = os.path.dirname(os.path.abspath(directory))
+        temporary_directory = tempfile.mkdtemp(dir=parent_directory)
+        try:
+            with open(os.path.join(temporary_directory, self.TROPES_FILE), 'w') as handler:
+                json.dump(self.tropes, handler)
+            for name in self.ARRAYS:
+                np.save(os.path.join(temporary_directory, f'{name}.npy'), getattr(self, name))
+            # Readers either see the complete store or no store at all
+            os.rename(temporary_directory, directory)
+        except OSError:
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+            if not os.path.isdir(directory):
+                raise
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, cls.TROPES_FILE), 'r') as handler:
+            tropes = json.load(handler)
+        arrays = [np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in cls.ARRAYS]
+        return cls(tropes, *arrays)
+
+    def __len__(self):
+        return len(self.rule_confidences)
+
+    def evaluate_just_rating(self, list_of_tropes: list):
+        trope_ids = [self.trope_ids.get(trope) for trope in list_of_tropes]
+        query_ids = set(trope_id for trope_id in trope_ids if trope_id is not None)
+
+        confidences = []
+        for consequent_id in trope_ids:
+            confidence = 0
+            if consequent_id is not None:
+                confidence = self._best_confidence(consequent_id, query_ids.difference([consequent_id]))
+            confidences.append(confidence)
+
+        return sum(confidences)
+
+    def _best_confidence(self, consequent_id, available_ids):
+        start = self.consequent_offsets[consequent_id]
+        end = self.consequent_offsets[consequent_id + 1]
+        end = start + np.searchsorted(self.entry_sizes[start:end], len(available_ids), side='right')
+        if end == start:
+            return 0
+
+        antecedent_offsets = self.entry_antecedent_offsets[start:end + 1]
+        antecedent_tropes = self.entry_antecedent_tropes[antecedent_offsets[0]:antecedent_offsets[-1]]
+        available = np.isin(antecedent_tropes, np.fromiter(available_ids, dtype=np.int32, count=len(available_ids)))
+        matching_entries = np.logical_and.reduceat(available, antecedent_offsets[:-1] - antecedent_offsets[0])
+        if not matching_entries.any():
+            return 0
+
+        return float(self.entry_confidences[start:end][matching_entries].max())
@@ -0,0 +1,80 @@
+import numpy as np
+from scipy.special import expit
+
+
+def _identity(values):
+    return values
+
+
+def _relu(values):
+    return np.maximum(values, 0, out=values)
+
+
+ACTIVATIONS = {'identity': _identity, 'logistic': expit, 'tanh': np.tanh, 'relu': _relu}
+
+
+class MultiLayerPerceptronEngine(object):
+    def __init__(self, neural_network, dtype='float32'):
+        self.dtype = np.dtype(dtype)
+        self.coefs = [np.ascontiguousarray(coef, dtype=self.dtype) for coef in neural_network.coefs_]
+        self.intercepts = [np.ascontiguousarray(intercept, dtype=self.dtype)
+                           for intercept in neural_network.intercepts_]
+        self.activation = ACTIVATIONS[neural_network.activation]
+        self.out_activation = ACTIVATIONS[neural_network.out_activation_]
+
+    def predict(self, lists_of_trope_indexes):
+        pre_activations = self.first_layer(lists_of_trope_indexes)
+        return self.forward_from_first_layer(pre_activations)
+
+    def first_layer(self, lists_of_trope_indexes):
+        # Inputs are binary, so the first layer is the sum of the weight rows of the active tropes
+        lists_of_trope_indexes = [sorted(set(trope_indexes)) for trope_indexes in lists_of_trope_indexes]
+        lengths = np.array([len(trope_indexes) for trope_indexes in lists_of_trope_indexes], dtype=np.intp)
+        flat_indexes = np.fromiter((index for trope_indexes in lists_of_trope_indexes for index in trope_indexes),
+                                   dtype=np.intp, count=lengths.sum())
+        return self._sum_weight_rows(flat_indexes, lengths)
+
+    def first_layer_from_rows(self, trope_index_rows):
+        # Rows of distinct, sorted trope indexes padded with -1, so the rows are summed in the same order as above
+        active = trope_index_rows >= 0
+        return self._sum_weight_rows(trope_index_rows[active].astype(np.intp), active.sum(axis=1))
+
+    def _sum_weight_rows(self, flat_indexes, lengths):
+        pre_activations = np.zeros((len(lengths), self.coefs[0].shape[1]), dtype=self.dtype)
+        if len(flat_indexes):
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            non_empty = lengths > 0
+            pre_activations[non_empty] = np.add.reduceat(self.coefs[0][flat_indexes], offsets[non_empty], axis=0)
+
+        pre_activations += self.intercepts[0]
+        return pre_activations
+
+    def update_first_layer(self, pre_activation, removed_trope_indexes, added_trope_indexes):
+        updated_pre_activation = pre_activation.copy()
+        if added_trope_indexes:
+            updated_pre_activation += self.coefs[0][list(added_trope_indexes)].sum(axis=0)
+        if removed_trope_indexes:
+            updated_pre_activation -= self.coefs[0][list(removed_trope_indexes)].sum(axis=0)
+        return updated_pre_activation
+
+    def forward_from_first_layer(self, pre_activations):
+        values = np.array(pre_activations, dtype=self.dtype, ndmin=2)
+        last_layer = len(self.coefs) - 1
+        for layer in range(len(self.coefs)):
+            if layer > 0:
+                # Unlike BLAS, einsum sums every row in the same order whatever the batch size, so a rating does
+                # not depend on how evaluations are grouped into batches or workers
+                values = np.einsum('ij,jk->ik', values, self.coefs[layer])
+                values += self.intercepts[layer]
+            activation = self.out_activation if layer == last_layer else self.activation
+            values = activation(values)
+
+        return values.ravel().astype(np.float64) if values.shape[1] == 1 else values.astype(np.float64)
+
+    def measure_drift(self, neural_network, inputs, lists_of_trope_indexes):
+        expected = neural_network.predict(inputs)
+        predicted = self.predict(lists_of_trope_indexes)
+        errors = np.abs(expected - predicted)
+        return {'samples': len(errors), 'dtype': self.dtype.name, 'max_absolute_error': float(errors.max()),
+                'mean_absolute_error': float(errors.mean()),
+                'max_relative_error': float((errors / np.maximum(np.abs(expected), np.finfo(float).tiny)).max())}
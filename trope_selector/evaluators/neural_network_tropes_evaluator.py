@@ -1,18 +1,48 @@
 import csv
 import logging
-from functools import lru_cache
+from collections import OrderedDict, namedtuple
 
 import joblib
+import numpy as np
+from scipy.sparse import csr_matrix
 
+from common.shared_value import SharedValue
 from common.string_utils import humanize_list
+from trope_selector.evaluators.multilayer_perceptron_engine import MultiLayerPerceptronEngine
+from trope_selector.evaluators.persistent_rating_cache import PersistentRatingCache
+from trope_selector.evaluators.rating_cache import RatingCache
+
+
+class FirstLayerState(SharedValue, namedtuple('FirstLayerState', ['trope_indexes', 'pre_activation', 'updates'])):
+    pass
 
 
 class NeuralNetworkTropesEvaluator():
     _logger = logging.getLogger(__name__)
+    MAX_INCREMENTAL_UPDATES = 64
 
-    def __init__(self, neural_network_dumped_file: str):
+    def __init__(self, neural_network_dumped_file: str, use_sparse_input=True, use_forward_engine=True,
+                 forward_engine_dtype='float32', rating_cache_size=100000, rating_cache_policy='lru',
+                 rating_cache_file=None):
+        self.use_sparse_input = use_sparse_input
+        self.use_forward_engine = use_forward_engine
+        self.forward_engine_dtype = forward_engine_dtype
+        self.engine = None
+        self.rating_cache = RatingCache(rating_cache_size, rating_cache_policy)
+        self.persistent_rating_cache = None
         self._load_neural_network(neural_network_dumped_file)
 
+        if rating_cache_file:
+            # Each prediction path rounds differently, so they do not share stored ratings
+            model_fingerprint = f'{PersistentRatingCache.fingerprint(neural_network_dumped_file)}/' \
+                                f'{self._get_prediction_path()}'
+            self.persistent_rating_cache = PersistentRatingCache(rating_cache_file, model_fingerprint)
+
+    def _get_prediction_path(self):
+        if self.engine:
+            return f'engine-{self.engine.dtype.name}'
+        return 'predict-sparse' if self.use_sparse_input else 'predict-dense'
+
     def _load_neural_network(self, neural_network_dumped_file):
         self.evaluator_resources = joblib.load(neural_network_dumped_file)
         self.neural_network = self.evaluator_resources['evaluator']
@@ -23,20 +53,150 @@ class NeuralNetworkTropesEvaluator():
 
         self.base_empty_input = [0 for index in range(0, len(self.tropes))]
 
+        if self.use_forward_engine:
+            self.engine = MultiLayerPerceptronEngine(self.neural_network, self.forward_engine_dtype)
+
     def evaluate(self, list_of_tropes: list):
         trope_indexes = self._build_list_of_trope_indexes(list_of_tropes)
-        input = self._build_input(trope_indexes)
-        predicted_rating = self.neural_network.predict([input])
+        predicted_rating = self._predict([trope_indexes])
 
         evaluation_tropes = [EvaluationTrope(name=self.tropes[index], index=index) for index in trope_indexes]
         evaluation = Evaluation(tropes=evaluation_tropes, rating=predicted_rating)
         return evaluation
 
-    @lru_cache(maxsize=None)
     def evaluate_just_rating(self, list_of_tropes: list):
-        trope_indexes = self._build_list_of_trope_indexes(list_of_tropes)
-        input = self._build_input(trope_indexes)
-        return self.neural_network.predict([input])
+        return np.array(self.evaluate_ratings([list_of_tropes]))
+
+    def evaluate_ratings(self, lists_of_tropes: list):
+        unique_lists_of_tropes = list(OrderedDict.fromkeys(tuple(list_of_tropes) for list_of_tropes in lists_of_tropes))
+
+        ratings = self._get_cached_ratings(unique_lists_of_tropes)
+        missing_lists_of_tropes = [list_of_tropes for list_of_tropes in unique_lists_of_tropes
+                                   if list_of_tropes not in ratings]
+        if missing_lists_of_tropes:
+            predicted_ratings = self._predict([self._build_list_of_trope_indexes(list_of_tropes)
+                                               for list_of_tropes in missing_lists_of_tropes])
+            self._store_ratings(ratings, missing_lists_of_tropes, predicted_ratings)
+
+        return [ratings[tuple(list_of_tropes)] for list_of_tropes in lists_of_tropes]
+
+    def evaluate_rating_rows(self, lists_of_tropes: list, trope_index_rows):
+        # Distinct trope tuples, which are the cache keys, each with its row of sorted trope indexes padded with -1
+        ratings = self._get_cached_ratings(lists_of_tropes)
+        missing_rows = [row for row, list_of_tropes in enumerate(lists_of_tropes) if list_of_tropes not in ratings]
+        if missing_rows:
+            predicted_ratings = self._predict_rows(trope_index_rows[missing_rows])
+            self._store_ratings(ratings, [lists_of_tropes[row] for row in missing_rows], predicted_ratings)
+
+        return [ratings[list_of_tropes] for list_of_tropes in lists_of_tropes]
+
+    def _get_cached_ratings(self, lists_of_tropes):
+        ratings = {}
+        missing_lists_of_tropes = []
+        for list_of_tropes in lists_of_tropes:
+            rating = self.rating_cache.get(list_of_tropes)
+            if rating is None:
+                missing_lists_of_tropes.append(list_of_tropes)
+            else:
+                ratings[list_of_tropes] = rating
+
+        if missing_lists_of_tropes and self.persistent_rating_cache:
+            stored_ratings = self.persistent_rating_cache.get_many(missing_lists_of_tropes)
+            for list_of_tropes, rating in stored_ratings.items():
+                ratings[list_of_tropes] = rating
+                self.rating_cache.set(list_of_tropes, rating)
+
+        return ratings
+
+    def _store_ratings(self, ratings, lists_of_tropes, predicted_ratings):
+        for list_of_tropes, rating in zip(lists_of_tropes, predicted_ratings):
+            ratings[list_of_tropes] = rating
+            self.rating_cache.set(list_of_tropes, rating)
+
+        if self.persistent_rating_cache:
+            self.persistent_rating_cache.set_many(dict(zip(lists_of_tropes, predicted_ratings)))
+
+    def evaluate_ratings_incrementally(self, lists_of_tropes: list, states: list):
+        if not self.engine:
+            raise Exception('Incremental evaluation requires the forward engine')
+
+        # Duplicates are rated once and cached trope sets are not rated at all. A state stays valid for any later
+        # update as long as it matches its own trope indexes, so a cached trope set keeps the state it had.
+        lists_of_tropes = [tuple(list_of_tropes) for list_of_tropes in lists_of_tropes]
+        base_states = OrderedDict()
+        for list_of_tropes, state in zip(lists_of_tropes, states):
+            if base_states.get(list_of_tropes) is None:
+                base_states[list_of_tropes] = state
+
+        ratings = self._get_cached_ratings(list(base_states.keys()))
+        missing_lists_of_tropes = [list_of_tropes for list_of_tropes in base_states if list_of_tropes not in ratings]
+        new_states = {}
+        if missing_lists_of_tropes:
+            for list_of_tropes in missing_lists_of_tropes:
+                trope_indexes = frozenset(self._build_list_of_trope_indexes(list_of_tropes))
+                new_states[list_of_tropes] = self._update_first_layer_state(trope_indexes,
+                                                                            base_states[list_of_tropes])
+            pre_activations = np.stack([new_states[list_of_tropes].pre_activation
+                                        for list_of_tropes in missing_lists_of_tropes])
+            self._store_ratings(ratings, missing_lists_of_tropes,
+                                self.engine.forward_from_first_layer(pre_activations))
+
+        return ([ratings[list_of_tropes] for list_of_tropes in lists_of_tropes],
+                [new_states.get(list_of_tropes, state) for list_of_tropes, state in zip(lists_of_tropes, states)])
+
+    def _update_first_layer_state(self, trope_indexes, state):
+        if state is None or state.updates >= self.MAX_INCREMENTAL_UPDATES:
+            return FirstLayerState(trope_indexes, self.engine.first_layer([trope_indexes])[0], 0)
+
+        removed_trope_indexes = state.trope_indexes - trope_indexes
+        added_trope_indexes = trope_indexes - state.trope_indexes
+        if not removed_trope_indexes and not added_trope_indexes:
+            return state
+        if len(removed_trope_indexes) + len(added_trope_indexes) >= len(trope_indexes):
+            return FirstLayerState(trope_indexes, self.engine.first_layer([trope_indexes])[0], 0)
+
+        pre_activation = self.engine.update_first_layer(state.pre_activation, removed_trope_indexes,
+                                                        added_trope_indexes)
+        return FirstLayerState(trope_indexes, pre_activation, state.updates + 1)
+
+    def measure_engine_drift(self, lists_of_tropes: list):
+        lists_of_trope_indexes = [self._build_list_of_trope_indexes(list_of_tropes)
+                                  for list_of_tropes in lists_of_tropes]
+        engine = self.engine if self.engine else MultiLayerPerceptronEngine(self.neural_network,
+                                                                           self.forward_engine_dtype)
+        return engine.measure_drift(self.neural_network, self._build_inputs(lists_of_trope_indexes),
+                                    lists_of_trope_indexes)
+
+    def close(self):
+        if self.persistent_rating_cache:
+            self.persistent_rating_cache.close()
+
+    def _predict(self, lists_of_trope_indexes):
+        if self.engine:
+            return self.engine.predict(lists_of_trope_indexes)
+
+        return self.neural_network.predict(self._build_inputs(lists_of_trope_indexes))
+
+    def _predict_rows(self, trope_index_rows):
+        if self.engine:
+            return self.engine.forward_from_first_layer(self.engine.first_layer_from_rows(trope_index_rows))
+
+        return self._predict([row[row >= 0].tolist() for row in trope_index_rows])
+
+    def _build_inputs(self, lists_of_trope_indexes):
+        if not self.use_sparse_input:
+            return [self._build_input(trope_indexes) for trope_indexes in lists_of_trope_indexes]
+
+        return self._build_sparse_input(lists_of_trope_indexes)
+
+    def _build_sparse_input(self, lists_of_trope_indexes):
+        indices = []
+        indptr = [0]
+        for trope_indexes in lists_of_trope_indexes:
+            indices.extend(sorted(set(trope_indexes)))
+            indptr.append(len(indices))
+        data = [1.0] * len(indices)
+        return csr_matrix((data, indices, indptr), shape=(len(lists_of_trope_indexes), len(self.tropes)))
 
     def _build_input(self, trope_indexes):
         input = self.base_empty_input.copy()
@@ -113,6 +273,14 @@ if __name__ == "__main__":
     print('Average error by number of tropes')
     print(json.dumps(average_error_by_tropes, sort_keys=True, indent=2))
 
+    # The films trained the model, so the drift is measured on random trope lists of the same sizes, which are
+    # closer to the trope sets rated by the genetic algorithm
+    from random import Random
+    drift_random = Random(0)
+    random_lists_of_tropes = [drift_random.sample(evaluator.tropes, len(film['tropes'])) for film in films]
+    print('Forward engine drift against predict on random trope lists')
+    print(json.dumps(evaluator.measure_engine_drift(random_lists_of_tropes), indent=2))
+
     print('Evaluation of 1 genre')
     genres = [trope for trope in evaluator.tropes if '[GENRE]' in trope]
     genres_evaluation = {genre:evaluator.evaluate_just_rating(genre)[0] for genre in genres}
@@ -0,0 +1,62 @@
+import hashlib
+import json
+import sqlite3
+
+
+class PersistentRatingCache(object):
+    MAX_VARIABLES_PER_QUERY = 500
+
+    def __init__(self, cache_file, model_fingerprint):
+        self.cache_file = cache_file
+        self.model_fingerprint = model_fingerprint
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(self.cache_file, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS ratings (model TEXT NOT NULL, tropes TEXT NOT NULL, '
+                                    'rating REAL NOT NULL, PRIMARY KEY (model, tropes)) WITHOUT ROWID')
+
+    @staticmethod
+    def fingerprint(model_file):
+        digest = hashlib.sha256()
+        with open(model_file, 'rb') as handler:
+            for block in iter(lambda: handler.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _build_key(list_of_tropes):
+        return json.dumps(sorted(list_of_tropes))
+
+    def get_many(self, lists_of_tropes: list):
+        keys = {}
+        for list_of_tropes in lists_of_tropes:
+            keys.setdefault(self._build_key(list_of_tropes), []).append(list_of_tropes)
+        pending_keys = list(keys.keys())
+
+        ratings = {}
+        for start in range(0, len(pending_keys), self.MAX_VARIABLES_PER_QUERY):
+            chunk = pending_keys[start:start + self.MAX_VARIABLES_PER_QUERY]
+            placeholders = ', '.join('?' for key in chunk)
+            rows = self.connection.execute(f'SELECT tropes, rating FROM ratings WHERE model = ? AND tropes IN '
+                                           f'({placeholders})', [self.model_fingerprint] + chunk)
+            for key, rating in rows:
+                for list_of_tropes in keys[key]:
+                    ratings[list_of_tropes] = rating
+
+        self.hits += len(ratings)
+        self.misses += len(lists_of_tropes) - len(ratings)
+        return ratings
+
+    def set_many(self, ratings: dict):
+        rows = [(self.model_fingerprint, self._build_key(list_of_tropes), float(rating))
+                for list_of_tropes, rating in ratings.items()]
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO ratings (model, tropes, rating) VALUES (?, ?, ?)',
+                                        rows)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+
+class RatingCache(object):
+    POLICIES = ['lru', 'slru']
+
+    def __init__(self, maxsize=100000, policy='lru', protected_ratio=0.8):
+        if policy not in self.POLICIES:
+            raise Exception(f'Unknown cache policy {policy}, expected one of {self.POLICIES}')
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.protected_size = int(maxsize * protected_ratio) if policy == 'slru' else 0
+        # With 'lru' every entry lives in the probationary segment
+        self.probationary = OrderedDict()
+        self.protected = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.probationary) + len(self.protected)
+
+    def get(self, key, default=None):
+        if key in self.protected:
+            self.protected.move_to_end(key)
+            self.hits += 1
+            return self.protected[key]
+
+        if key in self.probationary:
+            self.hits += 1
+            if self.policy == 'slru':
+                value = self.probationary.pop(key)
+                self._promote(key, value)
+                return value
+
+            self.probationary.move_to_end(key)
+            return self.probationary[key]
+
+        self.misses += 1
+        return default
+
+    def set(self, key, value):
+        if key in self.protected:
+            self.protected[key] = value
+            self.protected.move_to_end(key)
+            return
+
+        if self.maxsize <= 0:
+            return
+
+        self.probationary[key] = value
+        self.probationary.move_to_end(key)
+        while len(self) > self.maxsize:
+            segment = self.probationary if self.probationary else self.protected
+            segment.popitem(last=False)
+            self.evictions += 1
+
+    def _promote(self, key, value):
+        self.protected[key] = value
+        while len(self.protected) > self.protected_size:
+            demoted_key, demoted_value = self.protected.popitem(last=False)
+            self.probationary[demoted_key] = demoted_value
+
+    def get_statistics(self):
+        return OrderedDict([('size', len(self)), ('hits', self.hits), ('misses', self.misses),
+                            ('evictions', self.evictions)])
+
+    def clear(self):
+        self.probationary.clear()
+        self.protected.clear()
@@ -1,17 +1,42 @@
+import gzip
+import math
+import multiprocessing
+import os
+import pickle
 import statistics
 import random
+import time
+from collections import OrderedDict
+from sys import stderr
 
+import numpy as np
 from deap import creator, base, tools, algorithms
 
 from common.event import EventType
+from common.shared_value import SharedValue
+from trope_selector.evaluators.additive_trope_surrogate import AdditiveTropeSurrogate
 from trope_selector.evaluators.neural_network_tropes_evaluator import NeuralNetworkTropesEvaluator
 
 
+class SharedTuple(SharedValue, tuple):
+    pass
+
+
 class GeneticAlgorithm(object):
+    CHECKPOINT_VERSION = 2
+
     def __init__(self, random, characters, places, initial_positions, global_events, character_events,
                  character_tropes, place_tropes, move_tropes, confront_tropes, chase_resolution_tropes,resolve_tropes,
                  neural_network_file, old_style_seed, write=None, use_global_tropes_rating=False,
-                 use_character_backstory_tropes_rating=True):
+                 use_character_backstory_tropes_rating=True, use_batch_evaluation=True,
+                 use_incremental_evaluation=False, rating_cache_size=100000, rating_cache_policy='lru',
+                 rating_cache_file=None, workers=1, chunk_size=None, use_delta_evaluation=True, population_size=300,
+                 checkpoint_file=None, checkpoint_interval=10, resume_from=None, max_generations=100,
+                 max_evaluations=None, max_wall_time=None, patience=None, telemetry=None, surrogate_fraction=None,
+                 surrogate_exploration=0.1, surrogate_refit_interval=5, use_forward_engine=True,
+                 forward_engine_dtype='float32'):
+        if max_generations < 1:
+            raise Exception(f'At least one generation is needed, got {max_generations}')
 
         self.random = random
         self.characters = characters
@@ -29,42 +54,403 @@ class GeneticAlgorithm(object):
         self.neural_network_file = neural_network_file
         self.old_style_seed = old_style_seed
         self.write = write
+        self.telemetry = telemetry
         self.use_global_tropes_rating = use_global_tropes_rating
         self.use_character_backstory_tropes_rating = use_character_backstory_tropes_rating
+        self.use_batch_evaluation = use_batch_evaluation
+        self.use_incremental_evaluation = use_incremental_evaluation
+        self.use_delta_evaluation = use_delta_evaluation
+        self.rating_cache_size = rating_cache_size
+        self.rating_cache_policy = rating_cache_policy
+        self.rating_cache_file = rating_cache_file
+        self.use_forward_engine = use_forward_engine
+        self.forward_engine_dtype = forward_engine_dtype
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.population_size = population_size
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_interval = checkpoint_interval
+        self.resume_from = resume_from
+        self.max_generations = max_generations
+        self.max_evaluations = max_evaluations
+        self.max_wall_time = max_wall_time
+        self.patience = patience
+        self.surrogate_fraction = surrogate_fraction
+        self.surrogate_exploration = surrogate_exploration
+        self.surrogate_refit_interval = surrogate_refit_interval
+        self.surrogate = None
+        self.surrogate_random = None
+        self.surrogate_generations = 0
+        self.surrogate_screened = 0
+        self.surrogate_audits = 0
+        self.surrogate_best_changes = 0
+        self.pending_audit = None
+        self.started_at = None
+        self.generation_started_at = None
+        self.best_fitness_seen = None
+        self.generations_without_improvement = 0
+        self.character_genes = []
+        self.gene_characters = []
         self.evaluator = None
+        self.pool = None
+        self.worker_cache_statistics = {}
+        self.genome_fitness_memo = {}
+        self.evaluations = 0
         self.best = None
 
+    def __getstate__(self):
+        # Workers load their own evaluator, and the writer and the pool only live in the main process
+        state = self.__dict__.copy()
+        state['evaluator'] = None
+        state['pool'] = None
+        state['write'] = None
+        state['telemetry'] = None
+        state['genome_fitness_memo'] = {}
+        return state
+
     def prepare(self):
-        self.evaluator = NeuralNetworkTropesEvaluator(self.neural_network_file)
+        self.evaluator = NeuralNetworkTropesEvaluator(self.neural_network_file,
+                                                      use_forward_engine=self.use_forward_engine,
+                                                      forward_engine_dtype=self.forward_engine_dtype,
+                                                      rating_cache_size=self.rating_cache_size,
+                                                      rating_cache_policy=self.rating_cache_policy,
+                                                      rating_cache_file=self.rating_cache_file)
+        self.compile_gene_layout()
 
-    def run(self):
+    def compile_gene_layout(self):
+        # Each character's trope set is the set of tropes in a fixed list of genes, so the world is turned into
+        # per-character gene indexes once and an evaluation becomes a gather over the genome
+        genome_size = len(self.characters) + len(self.places) + len(self.global_events)
+        character_indexes = {character: index for index, character in enumerate(self.characters)}
+
+        self.character_genes = []
+        for character in self.characters:
+            genes = {self._get_place_gene(self.initial_positions[character])}
+            for event in self.character_events[character]:
+                if event.action != EventType.NOOP.value:
+                    genes.add(event.id + len(self.characters) + len(self.places))
+                    genes.add(character_indexes[event.protagonists[0]])
+                    if event.antagonists:
+                        genes.add(character_indexes[event.antagonists[0]])
+                    if event.action == EventType.MOVE.value and character in event.protagonists:
+                        genes.add(self._get_place_gene(event.places[1]))
+            self.character_genes.append(tuple(sorted(genes)))
+
+        self.gene_characters = [set() for gene in range(genome_size)]
+        for slot, genes in enumerate(self.character_genes):
+            for gene in genes:
+                self.gene_characters[gene].add(slot)
+
+    @staticmethod
+    def create_types():
         creator.create("FitnessMax", base.Fitness, weights=(1.0,))
         creator.create("Individual", list, fitness=creator.FitnessMax)
 
+    def build_toolbox(self):
         toolbox = base.Toolbox()
         toolbox.register("population", self.build_population(), creator.Individual)
         toolbox.register("evaluate", self.build_evaluator())
         toolbox.register("mate", tools.cxTwoPoint)
-
         toolbox.register("mutate", self.build_mutator(), indpb=0.05)
         toolbox.register("select", tools.selTournament, tournsize=3)
+        return toolbox
 
-        random.seed(self.old_style_seed)
-        population = toolbox.population(n=300)
+    def run(self):
+        self.create_types()
 
-        NGEN = 100
-        for gen in range(NGEN):
-            offspring = algorithms.varAnd(population, toolbox, cxpb=0.5, mutpb=0.1)
-            fits = toolbox.map(toolbox.evaluate, offspring)
-            for fit, ind in zip(fits, offspring):
-                ind.fitness.values = fit
-            population = toolbox.select(offspring, k=len(population))
-            best = tools.selBest(population, k=1)[0]
-            self.write(f'Generation={gen}, fitness={best.fitness.values[0]}, tropes={list(best)}')
+        toolbox = self.build_toolbox()
+        if self.workers > 1:
+            self.pool = multiprocessing.Pool(self.workers, initializer=_initialize_worker, initargs=(self,))
+            toolbox.register("map", self._parallel_map)
+            toolbox.register("evaluate", _evaluate_in_worker)
 
-        self.best = tools.selBest(population, k=1)[0]
+        try:
+            self._evolve(toolbox)
+        finally:
+            if self.pool:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+            self.evaluator.close()
+
+    def _evolve(self, toolbox):
+        self.genome_fitness_memo = {}
+        self.evaluations = 0
+        self.start_stopping_criteria()
+        self.start_surrogate()
+        if self.resume_from:
+            population, first_generation = self.load_checkpoint(self.resume_from)
+        else:
+            random.seed(self.old_style_seed)
+            population = toolbox.population(n=self.population_size)
+            first_generation = 0
+
+        for gen in range(first_generation, self.max_generations):
+            population, evaluation_counts = self.evolve_generation(toolbox, population)
+            best = self.select_best(population)
+            self.write_generation(gen, best.fitness.values[0], evaluation_counts, list(best),
+                                  [individual.fitness.values[0] for individual in population],
+                                  len(set(tuple(individual) for individual in population)) / len(population))
+            stop_reason = self.get_stop_reason(gen + 1, best.fitness.values[0])
+            if self.checkpoint_file and ((gen + 1) % self.checkpoint_interval == 0 or stop_reason):
+                self.save_checkpoint(self.checkpoint_file, population, gen + 1)
+            if stop_reason:
+                self.print_stop_reason(gen + 1, stop_reason)
+                break
+
+        if self.surrogate:
+            self.print_surrogate_summary()
+
+        self.best = self.select_best(population)
         self.fitness = self.best.fitness.values[0]
 
+    @staticmethod
+    def select_best(population):
+        # Surrogate scores are only estimates, so the best is chosen among the fully rated individuals
+        rated_population = [individual for individual in population
+                            if not getattr(individual, 'surrogate_rated', False)]
+        return tools.selBest(rated_population or population, k=1)[0]
+
+    def start_stopping_criteria(self):
+        self.started_at = time.monotonic()
+        self.generation_started_at = self.started_at
+        self.best_fitness_seen = None
+        self.generations_without_improvement = 0
+
+    def get_stop_reason(self, generations, fitness):
+        if self.best_fitness_seen is None or fitness > self.best_fitness_seen:
+            self.best_fitness_seen = fitness
+            self.generations_without_improvement = 0
+        else:
+            self.generations_without_improvement += 1
+
+        # Every criterion is checked between generations, so the budgets can be exceeded by one generation
+        if generations >= self.max_generations:
+            return 'maximum generations reached'
+        if self.max_evaluations is not None and self.evaluations >= self.max_evaluations:
+            return f'{self.evaluations} evaluations performed (maximum {self.max_evaluations})'
+        if self.max_wall_time is not None and time.monotonic() - self.started_at >= self.max_wall_time:
+            return f'maximum wall time of {self.max_wall_time}s reached'
+        if self.patience is not None and self.generations_without_improvement >= self.patience:
+            return f'no improvement in the last {self.generations_without_improvement} generations'
+        return None
+
+    @staticmethod
+    def print_stop_reason(generations, stop_reason):
+        print(f'Evolution stopped after {generations} generations: {stop_reason}', file=stderr)
+
+    def save_checkpoint(self, checkpoint_file, population, generation):
+        # Evaluation attributes, the fitness memo and the rating cache are kept too, so a resumed run rates exactly the
+        # same genomes, and incremental evaluation updates the same states. Worker caches are not reachable from here.
+        individuals = [(list(individual), individual.fitness.values,
+                        {key: value for key, value in vars(individual).items() if key != 'fitness'})
+                       for individual in population]
+        checkpoint = {'version': self.CHECKPOINT_VERSION, 'old_style_seed': self.old_style_seed,
+                      'genome_size': len(self.characters) + len(self.places) + len(self.global_events),
+                      'generation': generation, 'evaluations': self.evaluations, 'population': individuals,
+                      'genome_fitness_memo': self.genome_fitness_memo,
+                      'rating_cache': None if self.pool else self.evaluator.rating_cache,
+                      'best_fitness_seen': self.best_fitness_seen,
+                      'generations_without_improvement': self.generations_without_improvement,
+                      'random_state': self.random.getstate(), 'deap_random_state': random.getstate()}
+
+        # Written aside and renamed, so a run killed while saving keeps the previous checkpoint
+        temporary_file = f'{checkpoint_file}.tmp'
+        with gzip.open(temporary_file, 'wb') as handler:
+            pickle.dump(checkpoint, handler, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_file, checkpoint_file)
+
+    def load_checkpoint(self, checkpoint_file):
+        with gzip.open(checkpoint_file, 'rb') as handler:
+            checkpoint = pickle.load(handler)
+
+        if checkpoint.get('version') != self.CHECKPOINT_VERSION:
+            raise Exception(f'Unsupported checkpoint version {checkpoint.get("version")} in {checkpoint_file}')
+        genome_size = len(self.characters) + len(self.places) + len(self.global_events)
+        if checkpoint['old_style_seed'] != self.old_style_seed or checkpoint['genome_size'] != genome_size:
+            raise Exception(f'Checkpoint {checkpoint_file} was saved for a different world or seed')
+
+        population = []
+        for genome, fitness_values, attributes in checkpoint['population']:
+            individual = creator.Individual(genome)
+            if fitness_values:
+                individual.fitness.values = fitness_values
+            individual.__dict__.update(attributes)
+            population.append(individual)
+
+        self.evaluations = checkpoint['evaluations']
+        self.genome_fitness_memo = checkpoint['genome_fitness_memo']
+        if checkpoint['rating_cache'] is not None and not self.pool:
+            self.evaluator.rating_cache = checkpoint['rating_cache']
+        self.best_fitness_seen = checkpoint['best_fitness_seen']
+        self.generations_without_improvement = checkpoint['generations_without_improvement']
+        self.random.setstate(checkpoint['random_state'])
+        random.setstate(checkpoint['deap_random_state'])
+        return population, checkpoint['generation']
+
+    def evolve_generation(self, toolbox, population):
+        offspring = algorithms.varAnd(population, toolbox, cxpb=0.5, mutpb=0.1)
+        evaluation_counts = self.evaluate_offspring(toolbox, offspring)
+        population = toolbox.select(offspring, k=len(population))
+        return population, evaluation_counts
+
+    def write_generation(self, generation, fitness, evaluation_counts, tropes, fitnesses, diversity, timestamp=None):
+        cache_statistics = self.get_cache_statistics()
+        self.write(f'Generation={generation}, fitness={fitness}, '
+                   f'evaluated={evaluation_counts["evaluated"]}, reused={evaluation_counts["reused"]}, '
+                   f'deduplicated={evaluation_counts["deduplicated"]}, '
+                   f'cache_size={cache_statistics["size"]}, cache_hits={cache_statistics["hits"]}, '
+                   f'cache_misses={cache_statistics["misses"]}, cache_evictions={cache_statistics["evictions"]}, '
+                   f'tropes={tropes}')
+
+        # Generations evolved elsewhere (e.g. on islands) are written after they end, at the given timestamp
+        timestamp = time.time() if timestamp is None else timestamp
+        now = time.monotonic() - (time.time() - timestamp)
+        if self.telemetry:
+            # Diversity is the fraction of distinct genomes in the population
+            self.telemetry(OrderedDict([
+                ('timestamp', timestamp), ('generation', generation),
+                ('wall_time', now - self.generation_started_at), ('elapsed_time', now - self.started_at),
+                ('evaluations', evaluation_counts['evaluated']), ('total_evaluations', self.evaluations),
+                ('reused', evaluation_counts['reused']), ('deduplicated', evaluation_counts['deduplicated']),
+                ('cache_hits', cache_statistics['hits']), ('cache_misses', cache_statistics['misses']),
+                ('best_fitness', fitness), ('mean_fitness', statistics.mean(fitnesses)),
+                ('std_fitness', statistics.pstdev(fitnesses)), ('diversity', diversity), ('best_genome', tropes)]))
+        self.generation_started_at = now
+
+    def evaluate_offspring(self, toolbox, offspring):
+        # Individuals scored by the surrogate are screened again until they get a full rating
+        invalid_offspring = [individual for individual in offspring
+                             if not individual.fitness.valid or getattr(individual, 'surrogate_rated', False)]
+
+        # Tournament selection copies individuals around, so the same genome is often scored more than once
+        pending_offspring = OrderedDict()
+        for individual in invalid_offspring:
+            genome = tuple(individual)
+            if genome in self.genome_fitness_memo:
+                individual.fitness.values = self.genome_fitness_memo[genome]
+                if self.surrogate:
+                    individual.surrogate_rated = False
+            else:
+                pending_offspring.setdefault(genome, []).append(individual)
+
+        screened_offspring = OrderedDict()
+        if self.surrogate:
+            pending_offspring, screened_offspring = self.screen_offspring(offspring, pending_offspring)
+
+        unique_offspring = [individuals[0] for individuals in pending_offspring.values()]
+        if self.use_batch_evaluation:
+            fits = self.evaluate_population(unique_offspring)
+        else:
+            fits = toolbox.map(toolbox.evaluate, unique_offspring)
+
+        for fit, (genome, individuals) in zip(fits, pending_offspring.items()):
+            self.genome_fitness_memo[genome] = fit
+            for individual in individuals:
+                individual.fitness.values = fit
+                if self.surrogate:
+                    individual.surrogate_rated = False
+
+        if self.surrogate:
+            self.update_surrogate(unique_offspring, fits)
+
+        self.evaluations += len(unique_offspring)
+        screened_individuals = sum(len(individuals) for individuals in screened_offspring.values())
+        evaluation_counts = OrderedDict([('evaluated', len(unique_offspring)),
+                                         ('reused', len(offspring) - len(invalid_offspring)),
+                                         ('deduplicated',
+                                          len(invalid_offspring) - len(unique_offspring) - screened_individuals)])
+        if self.surrogate:
+            evaluation_counts['screened'] = len(screened_offspring)
+        return evaluation_counts
+
+    def start_surrogate(self):
+        if self.surrogate_fraction is None:
+            self.surrogate = None
+            return
+
+        tropes = sorted(set(self.character_tropes + self.place_tropes + self.move_tropes + self.confront_tropes +
+                            self.chase_resolution_tropes + self.resolve_tropes))
+        self.surrogate = AdditiveTropeSurrogate(tropes)
+        # A stream of its own, so screening does not shift the operators' random numbers
+        self.surrogate_random = random.Random(f'{self.old_style_seed}/surrogate')
+        self.surrogate_generations = 0
+        self.surrogate_screened = 0
+        self.surrogate_audits = 0
+        self.surrogate_best_changes = 0
+
+    def screen_offspring(self, offspring, pending_offspring):
+        self.surrogate_generations += 1
+        genomes = list(pending_offspring.keys())
+        if not genomes:
+            return pending_offspring, OrderedDict()
+
+        predictions = np.zeros(len(genomes))
+        if self.surrogate.is_fitted():
+            predictions = self.surrogate.predict([self.get_trope_sets(pending_offspring[genome][0])
+                                                  for genome in genomes])
+        order = np.argsort(-predictions, kind='stable')
+        promising = set(order[:math.ceil(len(genomes) * self.surrogate_fraction)].tolist())
+
+        # Every few generations all the offspring get a full rating, which provides unbiased samples for the refit
+        # and shows whether screening would have discarded the best offspring
+        if not self.surrogate.is_fitted() or self.surrogate_generations % self.surrogate_refit_interval == 0:
+            self.pending_audit = (offspring, [genomes[index] for index in promising])
+            return pending_offspring, OrderedDict()
+
+        remaining = [index for index in order.tolist() if index not in promising]
+        explored = self.surrogate_random.sample(remaining, k=round(len(remaining) * self.surrogate_exploration))
+        rated = promising.union(explored)
+
+        rated_offspring = OrderedDict()
+        screened_offspring = OrderedDict()
+        for index, genome in enumerate(genomes):
+            if index in rated:
+                rated_offspring[genome] = pending_offspring[genome]
+                continue
+
+            screened_offspring[genome] = pending_offspring[genome]
+            for individual in pending_offspring[genome]:
+                individual.fitness.values = (float(predictions[index]),)
+                individual.surrogate_rated = True
+
+        self.surrogate_screened += len(screened_offspring)
+        return rated_offspring, screened_offspring
+
+    def update_surrogate(self, rated_offspring, fits):
+        self.surrogate.add_samples([self.get_trope_sets(individual) for individual in rated_offspring],
+                                   [fit[0] for fit in fits])
+
+        if self.pending_audit:
+            offspring, promising_genomes = self.pending_audit
+            self.pending_audit = None
+            if self.surrogate.is_fitted():
+                best = tools.selBest(offspring, k=1)[0]
+                promising_genomes = set(promising_genomes)
+                rated_genomes = set(tuple(individual) for individual in rated_offspring)
+                self.surrogate_audits += 1
+                if tuple(best) in rated_genomes and tuple(best) not in promising_genomes:
+                    self.surrogate_best_changes += 1
+            self.surrogate.fit()
+
+    def print_surrogate_summary(self):
+        print(f'Surrogate: {self.surrogate_screened} offspring screened out; the best offspring would have been '
+              f'screened out in {self.surrogate_best_changes} of {self.surrogate_audits} audited generations',
+              file=stderr)
+
+    def get_cache_statistics(self):
+        cache_statistics = self.evaluator.rating_cache.get_statistics()
+        for worker_cache_statistics in self.worker_cache_statistics.values():
+            for key, value in worker_cache_statistics.items():
+                cache_statistics[key] += value
+        return cache_statistics
+
+    def _parallel_map(self, function, individuals):
+        return self.pool.map(function, individuals, chunksize=self._get_chunk_size(len(individuals)))
+
+    def _get_chunk_size(self, size):
+        return self.chunk_size if self.chunk_size else max(1, math.ceil(size / (self.workers * 4)))
+
     def build_population(self):
         def load_individuals(creator, n):
             individuals = []
@@ -101,45 +487,97 @@ class GeneticAlgorithm(object):
 
     def build_evaluator(self):
         def evaluate(individual):
-            evaluator = self.evaluator
-            if self.use_global_tropes_rating:
-                trope_set = set(individual)
-                if None in trope_set:
-                    trope_set.remove(None)
-                evaluation = evaluator.evaluate_just_rating(tuple(sorted(list(trope_set))))
-                return evaluation[0],
-
-            if self.use_character_backstory_tropes_rating:
-                ratings = []
-                for character in self.characters:
-                    initial_place = self.initial_positions[character]
-                    initial_place_trope = self.get_trope_for_place(individual, initial_place)
-                    trope_set = set([initial_place_trope])
-                    for event in self.character_events[character]:
-                        if event.action != EventType.NOOP.value:
-                            event_trope = individual[event.id+len(self.characters)+len(self.places)]
-                            trope_set.add(event_trope)
-                            protagonist_trope = individual[int(event.protagonists[0].replace('c',''))]
-                            trope_set.add(protagonist_trope)
-                            if event.antagonists:
-                                antagonist_trope = individual[int(event.antagonists[0].replace('c', ''))]
-                                trope_set.add(antagonist_trope)
-                            if event.action == EventType.MOVE.value and character in event.protagonists:
-                                place_trope = self.get_trope_for_place(individual, event.places[1])
-                                trope_set.add(place_trope)
-
-                    if None in trope_set:
-                        trope_set.remove(None)
-
-                    evaluation = evaluator.evaluate_just_rating(tuple(sorted(list(trope_set))))
-                    ratings.append(evaluation[0])
-
-                return statistics.mean(ratings),
+            trope_sets = self.get_trope_sets(individual)
+            ratings = [self.evaluator.evaluate_just_rating(trope_set)[0] for trope_set in trope_sets]
+            return statistics.mean(ratings),
 
         return evaluate
 
+    def evaluate_population(self, individuals):
+        if self.pool:
+            return self._evaluate_population_in_workers(individuals)
+
+        rating_slots = self._get_rating_slots()
+        ratings_by_individual = []
+        states_by_individual = []
+        pending_ratings = []
+        for individual_index, individual in enumerate(individuals):
+            ratings_by_individual.append(list(getattr(individual, 'character_ratings', [None] * rating_slots)))
+            states_by_individual.append(list(getattr(individual, 'character_states', [None] * rating_slots)))
+            for slot in self._get_changed_rating_slots(individual):
+                pending_ratings.append((individual_index, slot, self.get_trope_set(individual, slot)))
+
+        trope_sets = [trope_set for individual_index, slot, trope_set in pending_ratings]
+        if self.use_incremental_evaluation:
+            states = [states_by_individual[individual_index][slot]
+                      for individual_index, slot, trope_set in pending_ratings]
+            ratings, states = self.evaluator.evaluate_ratings_incrementally(trope_sets, states)
+            for (individual_index, slot, trope_set), state in zip(pending_ratings, states):
+                states_by_individual[individual_index][slot] = state
+        else:
+            ratings = self.evaluator.evaluate_ratings(trope_sets)
+
+        for (individual_index, slot, trope_set), rating in zip(pending_ratings, ratings):
+            ratings_by_individual[individual_index][slot] = rating
+
+        fits = []
+        for individual, individual_ratings, individual_states in zip(individuals, ratings_by_individual,
+                                                                     states_by_individual):
+            individual.rated_genome = SharedTuple(individual)
+            individual.character_ratings = SharedTuple(individual_ratings)
+            if self.use_incremental_evaluation:
+                individual.character_states = SharedTuple(individual_states)
+            fits.append((statistics.mean(individual_ratings),))
+        return fits
+
+    def _get_rating_slots(self):
+        if self.use_global_tropes_rating:
+            return 1
+        return len(self.characters) if self.use_character_backstory_tropes_rating else 0
+
+    def _get_changed_rating_slots(self, individual):
+        rated_genome = getattr(individual, 'rated_genome', None)
+        if not self.use_delta_evaluation or self.use_global_tropes_rating or rated_genome is None:
+            return range(self._get_rating_slots())
+
+        # Only the characters whose trope sets depend on a changed gene have to be rated again
+        changed_slots = set()
+        for gene, (rated_trope, trope) in enumerate(zip(rated_genome, individual)):
+            if rated_trope != trope:
+                changed_slots.update(self.gene_characters[gene])
+        return sorted(changed_slots)
+
+    def _evaluate_population_in_workers(self, individuals):
+        chunk_size = self._get_chunk_size(len(individuals))
+        chunks = [individuals[start:start + chunk_size] for start in range(0, len(individuals), chunk_size)]
+
+        fits = []
+        for chunk, (chunk_fits, chunk_attributes, pid, cache_statistics) in zip(
+                chunks, self.pool.map(_evaluate_population_in_worker, chunks)):
+            fits.extend(chunk_fits)
+            # Attributes attached during evaluation (e.g. incremental states) have to travel back with the results
+            for individual, attributes in zip(chunk, chunk_attributes):
+                individual.__dict__.update(attributes)
+            self.worker_cache_statistics[pid] = cache_statistics
+        return fits
+
+    def get_trope_sets(self, individual):
+        return [self.get_trope_set(individual, slot) for slot in range(self._get_rating_slots())]
+
+    def get_trope_set(self, individual, slot):
+        if self.use_global_tropes_rating:
+            trope_set = set(individual)
+        else:
+            trope_set = {individual[gene] for gene in self.character_genes[slot]}
+
+        trope_set.discard(None)
+        return tuple(sorted(trope_set))
+
+    def _get_place_gene(self, place_name):
+        return self.places_index[place_name] + len(self.characters)
+
     def get_trope_for_place(self, individual, place_name):
-        return individual[self.places_index[place_name] + len(self.characters)]
+        return individual[self._get_place_gene(place_name)]
 
     def build_mutator(self):
         def mutator(individual, indpb):
@@ -170,4 +608,27 @@ class GeneticAlgorithm(object):
         return mutator
 
     def get_best(self):
-        return self.best
\ No newline at end of file
+        return self.best
+
+
+_worker_algorithm = None
+_worker_evaluate = None
+
+
+def _initialize_worker(algorithm):
+    global _worker_algorithm, _worker_evaluate
+    algorithm.create_types()
+    algorithm.prepare()
+    _worker_algorithm = algorithm
+    _worker_evaluate = algorithm.build_evaluator()
+
+
+def _evaluate_in_worker(individual):
+    return _worker_evaluate(individual)
+
+
+def _evaluate_population_in_worker(individuals):
+    fits = _worker_algorithm.evaluate_population(individuals)
+    attributes = [{key: value for key, value in vars(individual).items() if key != 'fitness'}
+                  for individual in individuals]
+    return fits, attributes, os.getpid(), _worker_algorithm.evaluator.rating_cache.get_statistics()
@@ -0,0 +1,157 @@
+import copy
+import multiprocessing
+import os
+import random
+import time
+from collections import OrderedDict
+
+from deap import tools
+
+from trope_selector.genetic_algorithms.genetic_algorithm import GeneticAlgorithm
+
+
+class Island(object):
+    def __init__(self, index, random, deap_random_state):
+        self.index = index
+        # Used by the population builder and the mutator
+        self.random = random
+        # deap's crossover and selection draw from the global random module
+        self.deap_random_state = deap_random_state
+        # Genomes already rated on this island, whatever the worker process it runs on
+        self.genome_fitness_memo = {}
+        self.population = None
+
+
+class IslandGeneticAlgorithm(GeneticAlgorithm):
+    def __init__(self, *args, islands=4, migration_interval=10, migration_size=5, **kwargs):
+        super().__init__(*args, **kwargs)
+        if islands < 1:
+            raise Exception(f'At least one island is needed, got {islands}')
+        if migration_size >= self.population_size:
+            raise Exception(f'Migration size {migration_size} must be smaller than the population size '
+                            f'{self.population_size}')
+
+        self.islands = islands
+        self.migration_interval = migration_interval
+        self.migration_size = migration_size
+
+    def build_islands(self):
+        islands = []
+        for index in range(self.islands):
+            # String seeds are hashed deterministically, so every island gets the same streams on every run
+            island_random = random.Random(f'{self.old_style_seed}/island/{index}')
+            deap_random = random.Random(f'{self.old_style_seed}/island/{index}/deap')
+            islands.append(Island(index, island_random, deap_random.getstate()))
+        return islands
+
+    def run(self):
+        self.create_types()
+
+        processes = self.workers if self.workers > 1 else min(self.islands, os.cpu_count() or 1)
+        self.pool = multiprocessing.Pool(processes, initializer=_initialize_island_worker, initargs=(self,))
+        try:
+            self._evolve_islands()
+        finally:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            self.evaluator.close()
+
+    def _evolve_islands(self):
+        self.evaluations = 0
+        self.start_stopping_criteria()
+        islands = self.build_islands()
+
+        gen = 0
+        stop_reason = None
+        while not stop_reason:
+            remaining_generations = self.max_generations - gen
+            generations = min(self.migration_interval or remaining_generations, remaining_generations)
+            results = self.pool.map(_evolve_island, [(island, generations) for island in islands])
+
+            islands = []
+            histories = []
+            for island, history, pid, cache_statistics in results:
+                islands.append(island)
+                histories.append(history)
+                self.worker_cache_statistics[pid] = cache_statistics
+
+            # Islands are only synchronised between migration rounds, so a round is always completed
+            for generation_results in zip(*histories):
+                best_fitness = self._write_global_generation(gen, generation_results)
+                gen += 1
+                stop_reason = stop_reason or self.get_stop_reason(gen, best_fitness)
+
+            if stop_reason:
+                self.print_stop_reason(gen, stop_reason)
+            else:
+                self.migrate(islands)
+
+        self.best = max((tools.selBest(island.population, k=1)[0] for island in islands),
+                        key=lambda individual: individual.fitness.values[0])
+        self.fitness = self.best.fitness.values[0]
+
+    def migrate(self, islands):
+        if len(islands) < 2 or not self.migration_size:
+            return
+
+        # Ring topology: the best individuals of each island replace the worst ones of the next island
+        migrants = [tools.selBest(island.population, k=self.migration_size) for island in islands]
+        for index, island in enumerate(islands):
+            incoming = migrants[index - 1]
+            worst = tools.selWorst(island.population, k=self.migration_size)
+            worst_ids = set(id(individual) for individual in worst)
+            survivors = [individual for individual in island.population if id(individual) not in worst_ids]
+            island.population = survivors + [copy.deepcopy(individual) for individual in incoming]
+
+    def _write_global_generation(self, generation, generation_results):
+        best_fitness, evaluation_counts, best_tropes, _, _, _ = max(generation_results, key=lambda result: result[0])
+        global_counts = OrderedDict((key, sum(result[1][key] for result in generation_results))
+                                    for key in evaluation_counts.keys())
+        fitnesses = [fitness for result in generation_results for fitness in result[3]]
+        # Genomes are only compared inside each island, migrants make the islands overlap very little
+        distinct_genomes = sum(result[4] for result in generation_results)
+
+        # A generation ends when its slowest island ends it
+        finished_at = max(result[5] for result in generation_results)
+
+        self.evaluations += global_counts['evaluated']
+        self.write_generation(generation, best_fitness, global_counts, best_tropes, fitnesses,
+                              distinct_genomes / len(fitnesses), timestamp=finished_at)
+        return best_fitness
+
+
+_worker_algorithm = None
+_worker_toolbox = None
+
+
+def _initialize_island_worker(algorithm):
+    global _worker_algorithm, _worker_toolbox
+    algorithm.create_types()
+    algorithm.prepare()
+    _worker_algorithm = algorithm
+    _worker_toolbox = algorithm.build_toolbox()
+
+
+def _evolve_island(arguments):
+    island, generations = arguments
+    # The toolbox operators read self.random when called, so the island only has to lend its generators and memo
+    _worker_algorithm.random = island.random
+    _worker_algorithm.genome_fitness_memo = island.genome_fitness_memo
+    random.setstate(island.deap_random_state)
+
+    if island.population is None:
+        island.population = _worker_toolbox.population(n=_worker_algorithm.population_size)
+
+    history = []
+    for generation in range(generations):
+        island.population, evaluation_counts = _worker_algorithm.evolve_generation(_worker_toolbox,
+                                                                                   island.population)
+        best = tools.selBest(island.population, k=1)[0]
+        history.append((best.fitness.values[0], evaluation_counts, list(best),
+                        [individual.fitness.values[0] for individual in island.population],
+                        len(set(tuple(individual) for individual in island.population)), time.time()))
+
+    island.deap_random_state = random.getstate()
+    _worker_algorithm.genome_fitness_memo = {}
+    return island, history, os.getpid(), _worker_algorithm.evaluator.rating_cache.get_statistics()
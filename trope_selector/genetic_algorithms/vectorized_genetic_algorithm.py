@@ -0,0 +1,162 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from common.event import EventType
+from trope_selector.genetic_algorithms.genetic_algorithm import GeneticAlgorithm
+
+
+class VectorizedGeneticAlgorithm(GeneticAlgorithm):
+    NO_TROPE = 0
+
+    def __init__(self, *args, crossover_probability=0.5, mutation_probability=0.1, gene_mutation_probability=0.05,
+                 tournament_size=3, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.crossover_probability = crossover_probability
+        self.mutation_probability = mutation_probability
+        self.gene_mutation_probability = gene_mutation_probability
+        self.tournament_size = tournament_size
+
+        self.trope_names = []
+        self.trope_name_array = None
+        self.candidates = None
+        self.candidates_sizes = None
+        self.gene_pools = None
+        self.trope_inputs = None
+        self.character_gene_arrays = []
+        self.numpy_random = None
+
+    def prepare(self):
+        super().prepare()
+        self.compile_candidate_tables()
+
+    def compile_candidate_tables(self):
+        pools = [self.character_tropes, self.place_tropes, self.move_tropes, self.confront_tropes,
+                 self.chase_resolution_tropes, self.resolve_tropes, []]
+        pool_by_action = {EventType.MOVE.value: 2, EventType.CONFRONT.value: 3, EventType.CHASE_RESOLUTION.value: 4,
+                          EventType.RESOLVE.value: 5}
+
+        # Trope id 0 stands for the genes without candidates (e.g. noop events)
+        self.trope_names = [None] + sorted(set(trope for pool in pools for trope in pool))
+        self.trope_name_array = np.array(self.trope_names, dtype=object)
+        trope_ids = {trope: trope_id for trope_id, trope in enumerate(self.trope_names)}
+
+        self.candidates = np.full((len(pools), max(len(pool) for pool in pools) or 1), self.NO_TROPE, dtype=np.int32)
+        for pool_index, pool in enumerate(pools):
+            self.candidates[pool_index, :len(pool)] = [trope_ids[trope] for trope in pool]
+        self.candidates_sizes = np.array([max(len(pool), 1) for pool in pools], dtype=np.int64)
+
+        self.gene_pools = np.array([0] * len(self.characters) + [1] * len(self.places) +
+                                   [pool_by_action.get(event.action, len(pools) - 1) for event in self.global_events],
+                                   dtype=np.int64)
+
+        # Model input index of every trope id, -1 when the model does not know the trope
+        self.trope_inputs = np.array([self.evaluator.tropes_reverse_index.get(trope, -1) if trope else -1
+                                      for trope in self.trope_names], dtype=np.int64)
+        if self.use_global_tropes_rating:
+            self.character_gene_arrays = [np.arange(len(self.gene_pools))]
+        else:
+            self.character_gene_arrays = [np.array(genes, dtype=np.int64) for genes in self.character_genes]
+
+    def run(self):
+        try:
+            self._evolve_population()
+        finally:
+            self.evaluator.close()
+
+    def _evolve_population(self):
+        self.numpy_random = np.random.default_rng(self.old_style_seed)
+        self.evaluations = 0
+        self.start_stopping_criteria()
+
+        population = self._random_genes(self.population_size)
+        fitnesses = np.full(self.population_size, np.nan)
+
+        for gen in range(self.max_generations):
+            population, fitnesses = self._vary(population, fitnesses)
+            evaluation_counts = self._evaluate_invalid(population, fitnesses)
+            population, fitnesses = self._select(population, fitnesses)
+
+            best_index = int(np.argmax(fitnesses))
+            self.write_generation(gen, float(fitnesses[best_index]), evaluation_counts,
+                                  self.decode(population[best_index]), fitnesses.tolist(),
+                                  len(np.unique(population, axis=0)) / len(population))
+            stop_reason = self.get_stop_reason(gen + 1, float(fitnesses[best_index]))
+            if stop_reason:
+                self.print_stop_reason(gen + 1, stop_reason)
+                break
+
+        best_index = int(np.argmax(fitnesses))
+        self.best = self.decode(population[best_index])
+        self.fitness = float(fitnesses[best_index])
+
+    def _random_genes(self, size):
+        indexes = self.numpy_random.integers(0, self.candidates_sizes[self.gene_pools],
+                                             size=(size, len(self.gene_pools)))
+        return self.candidates[self.gene_pools, indexes].astype(np.int32)
+
+    def _vary(self, population, fitnesses):
+        offspring = population.copy()
+        fitnesses = fitnesses.copy()
+        size, genome_size = offspring.shape
+
+        # Two-point crossover between consecutive pairs, with the same cut points as deap's cxTwoPoint (whose randint
+        # bounds are inclusive)
+        pairs = size // 2
+        crossed = self.numpy_random.random(pairs) < self.crossover_probability
+        first_points = self.numpy_random.integers(1, genome_size + 1, size=pairs)
+        second_points = self.numpy_random.integers(1, genome_size, size=pairs)
+        second_points = np.where(second_points >= first_points, second_points + 1, second_points)
+        first_points, second_points = np.minimum(first_points, second_points), np.maximum(first_points, second_points)
+        genes = np.arange(genome_size)
+        swapped = crossed[:, None] & (genes >= first_points[:, None]) & (genes < second_points[:, None])
+        firsts, seconds = offspring[0:2 * pairs:2], offspring[1:2 * pairs:2]
+        firsts[swapped], seconds[swapped] = seconds[swapped], firsts[swapped]
+
+        mutated = self.numpy_random.random(size) < self.mutation_probability
+        mutated_genes = mutated[:, None] & (self.numpy_random.random((size, genome_size)) <
+                                            self.gene_mutation_probability)
+        offspring = np.where(mutated_genes, self._random_genes(size), offspring)
+
+        changed = np.repeat(crossed, 2)
+        changed = np.concatenate((changed, np.zeros(size - len(changed), dtype=bool))) | mutated
+        fitnesses[changed] = np.nan
+        return offspring, fitnesses
+
+    def _evaluate_invalid(self, population, fitnesses):
+        invalid_indexes = np.flatnonzero(np.isnan(fitnesses))
+        unique_genomes, inverse = np.unique(population[invalid_indexes], axis=0, return_inverse=True)
+
+        ratings = np.empty((len(unique_genomes), len(self.character_gene_arrays)))
+        for slot, genes in enumerate(self.character_gene_arrays):
+            trope_sets, trope_set_inverse = self._get_trope_sets(unique_genomes[:, genes])
+            # Trope ids follow the order of the names, so the keys are the same sorted tuples as the deap engine
+            # uses and both engines share the rating caches
+            starts = np.count_nonzero(trope_sets == self.NO_TROPE, axis=1).tolist()
+            lists_of_tropes = [tuple(names[start:]) for names, start in
+                               zip(self.trope_name_array[trope_sets].tolist(), starts)]
+            inputs = np.sort(self.trope_inputs[trope_sets], axis=1)
+            slot_ratings = np.array(self.evaluator.evaluate_rating_rows(lists_of_tropes, inputs))
+            ratings[:, slot] = slot_ratings[trope_set_inverse.ravel()]
+
+        fitnesses[invalid_indexes] = ratings.mean(axis=1)[inverse.ravel()]
+
+        self.evaluations += len(unique_genomes)
+        return OrderedDict([('evaluated', len(unique_genomes)), ('reused', len(population) - len(invalid_indexes)),
+                            ('deduplicated', len(invalid_indexes) - len(unique_genomes))])
+
+    def _get_trope_sets(self, trope_ids):
+        # Repeated tropes are turned into NO_TROPE, so every distinct set becomes the same sorted row
+        trope_ids = np.sort(trope_ids, axis=1)
+        repeated = np.zeros(trope_ids.shape, dtype=bool)
+        repeated[:, 1:] = trope_ids[:, 1:] == trope_ids[:, :-1]
+        trope_ids = np.sort(np.where(repeated, self.NO_TROPE, trope_ids), axis=1)
+        return np.unique(trope_ids, axis=0, return_inverse=True)
+
+    def _select(self, population, fitnesses):
+        aspirants = self.numpy_random.integers(0, len(population), size=(len(population), self.tournament_size))
+        winners = aspirants[np.arange(len(population)), np.argmax(fitnesses[aspirants], axis=1)]
+        return population[winners], fitnesses[winners]
+
+    def decode(self, genome):
+        return [self.trope_names[trope_id] for trope_id in genome]
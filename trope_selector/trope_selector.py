@@ -1,14 +1,25 @@
 import json
+import os
+import re
 import sys
+import tempfile
 from collections import OrderedDict
+from random import Random
 from sys import stderr
 
-from common.event import Event, EventType
+from common.event import EventType
+from common.event_store import EventStore
 from common.story_tropes import StoryTropes
 from trope_selector.genetic_algorithms.genetic_algorithm import GeneticAlgorithm
+from trope_selector.genetic_algorithms.island_genetic_algorithm import IslandGeneticAlgorithm
+from trope_selector.genetic_algorithms.vectorized_genetic_algorithm import VectorizedGeneticAlgorithm
 
 
 class TropeSelector(object):
+    ENGINES = {'deap': GeneticAlgorithm, 'numpy': VectorizedGeneticAlgorithm}
+    # float64 gives the same ratings as the network's predict, float32 is faster
+    FORWARD_ENGINE_DTYPES = ['float32', 'float64']
+
     def __init__(self, random, world_resource, tropes_resource, old_style_seed, extended_dataset_resource=None,
                  neural_network_file=None, output_solution_file=None):
         self.random = random
@@ -21,7 +32,6 @@ class TropeSelector(object):
         self.global_events = []
         self.grid_size = 0
         self.character_events = OrderedDict()
-        self.events_by_id = OrderedDict()
         self.neural_network_file = neural_network_file
         self.output_solution_file = output_solution_file
 
@@ -60,17 +70,7 @@ class TropeSelector(object):
 
         self.initial_positions = log['INITIAL_POSITIONS']
 
-        for event_dictionary in log['EVENTS']['GLOBAL']:
-            event = Event(**event_dictionary)
-            self.global_events.append(event)
-            self.events_by_id[event.id] = event
-
-        for character in self.characters:
-            self.character_events[character] = []
-            for event_dictionary in log['EVENTS'][character]:
-                id = event_dictionary['id']
-                event = self.events_by_id[id]
-                self.character_events[character].append(event)
+        self.global_events, self.character_events = EventStore.from_log(log, self.characters)
 
         if self.extended_dataset_resource:
             with open(self.extended_dataset_resource, 'r') as handler:
@@ -142,17 +142,65 @@ class TropeSelector(object):
 
         return StoryTropes(character_tropes, place_tropes, event_tropes)
 
-    def select_best_tropes(self):
+    def select_best_tropes(self, rating_cache_size=100000, rating_cache_policy='lru', rating_cache_file=None,
+                           workers=1, chunk_size=None, engine='deap', population_size=300, islands=1,
+                           migration_interval=10, migration_size=5, checkpoint_file=None, checkpoint_interval=10,
+                           resume_from=None, max_generations=100, max_evaluations=None, max_wall_time=None,
+                           patience=None, telemetry_file=None, surrogate_fraction=None, surrogate_exploration=0.1,
+                           surrogate_refit_interval=5, incremental_evaluation=False, use_forward_engine=True,
+                           forward_engine_dtype='float32'):
         if not self.neural_network_file:
             raise Exception('No neural network file provided')
-
-        algorithm = GeneticAlgorithm(self.random, self.characters, self.places, self.initial_positions,
-                                     self.global_events, self.character_events, self.character_tropes,
-                                     self.place_tropes, self.move_tropes, self.confront_tropes,
-                                     self.chase_resolution_tropes, self.resolve_tropes,
-                                     self.neural_network_file, self.old_style_seed, write=self.build_output_writer())
-        algorithm.prepare()
-        algorithm.run()
+        if engine not in self.ENGINES:
+            raise Exception(f'Unknown engine {engine}, expected one of {list(self.ENGINES.keys())}')
+        if engine != 'deap' and (workers > 1 or chunk_size is not None):
+            raise Exception('Worker processes are only available for the deap engine')
+        if engine != 'deap' and incremental_evaluation:
+            raise Exception('Incremental evaluation is only available for the deap engine')
+        if incremental_evaluation and not use_forward_engine:
+            raise Exception('Incremental evaluation requires the forward engine')
+        if forward_engine_dtype not in self.FORWARD_ENGINE_DTYPES:
+            raise Exception(f'Unknown forward engine dtype {forward_engine_dtype}, expected one of '
+                            f'{self.FORWARD_ENGINE_DTYPES}')
+        if (checkpoint_file or resume_from) and (engine != 'deap' or islands > 1):
+            raise Exception('Checkpoints are only available for the single-population deap engine')
+        if surrogate_fraction is not None and (engine != 'deap' or islands > 1 or checkpoint_file or resume_from):
+            raise Exception('The surrogate is only available for the single-population deap engine, '
+                            'without checkpoints')
+
+        algorithm_class = self.ENGINES[engine]
+        algorithm_options = {}
+        if islands > 1:
+            if engine != 'deap':
+                raise Exception('The island model is only available for the deap engine')
+            algorithm_class = IslandGeneticAlgorithm
+            algorithm_options = dict(islands=islands, migration_interval=migration_interval,
+                                     migration_size=migration_size)
+
+        algorithm = algorithm_class(self.random, self.characters, self.places, self.initial_positions,
+                                    self.global_events, self.character_events, self.character_tropes,
+                                    self.place_tropes, self.move_tropes, self.confront_tropes,
+                                    self.chase_resolution_tropes, self.resolve_tropes,
+                                    self.neural_network_file, self.old_style_seed, write=self.build_output_writer(),
+                                    rating_cache_size=rating_cache_size, rating_cache_policy=rating_cache_policy,
+                                    rating_cache_file=rating_cache_file, workers=workers, chunk_size=chunk_size,
+                                    population_size=population_size, checkpoint_file=checkpoint_file,
+                                    checkpoint_interval=checkpoint_interval, resume_from=resume_from,
+                                    max_generations=max_generations, max_evaluations=max_evaluations,
+                                    max_wall_time=max_wall_time, patience=patience,
+                                    surrogate_fraction=surrogate_fraction, surrogate_exploration=surrogate_exploration,
+                                    surrogate_refit_interval=surrogate_refit_interval,
+                                    use_incremental_evaluation=incremental_evaluation,
+                                    use_forward_engine=use_forward_engine, forward_engine_dtype=forward_engine_dtype,
+                                    **algorithm_options)
+        telemetry_handler = open(telemetry_file, 'w') if telemetry_file else None
+        algorithm.telemetry = self.build_telemetry_writer(telemetry_handler) if telemetry_handler else None
+        try:
+            algorithm.prepare()
+            algorithm.run()
+        finally:
+            if telemetry_handler:
+                telemetry_handler.close()
         best = algorithm.get_best()
 
         character_tropes = best[0:len(self.characters)]
@@ -168,6 +216,51 @@ class TropeSelector(object):
 
         return write
 
+    @staticmethod
+    def build_telemetry_writer(handler):
+        def write_telemetry(record):
+            handler.write(json.dumps(record) + '\n')
+            handler.flush()
+
+        return write_telemetry
+
     def close(self):
         if self.output_file and not self.output_file.closed:
-            self.output_file.close()
\ No newline at end of file
+            self.output_file.close()
+
+def compare_with_resumed_run(world_resource, tropes_resource, neural_network_file, seed=0, checkpoint_generation=10,
+                             **options):
+    # Runs the genetic algorithm once uninterrupted and once stopped at a checkpoint and resumed, and checks that both
+    # write the same generations. Worker rating caches are not checkpointed, so with workers their counters are
+    # left out.
+    with tempfile.TemporaryDirectory() as directory:
+        checkpoint_file = os.path.join(directory, 'checkpoint.pkl.gz')
+        runs = OrderedDict([
+            ('uninterrupted', {}),
+            ('interrupted', dict(max_generations=checkpoint_generation, checkpoint_file=checkpoint_file)),
+            ('resumed', dict(resume_from=checkpoint_file))])
+        logs = OrderedDict()
+        for name, run_options in runs.items():
+            output_file = os.path.join(directory, f'{name}.txt')
+            selector = TropeSelector(Random(seed), world_resource, tropes_resource, seed + 1,
+                                     neural_network_file=neural_network_file, output_solution_file=output_file)
+            selector.prepare()
+            try:
+                selector.select_best_tropes(**dict(options, **run_options))
+            finally:
+                selector.close()
+            with open(output_file, 'r') as handler:
+                logs[name] = [re.sub(r'cache_\w+=\d+, ', '', line) if options.get('workers', 1) > 1 else line
+                              for line in handler]
+
+    if len(logs['interrupted']) != checkpoint_generation:
+        raise Exception(f'The run stopped after {len(logs["interrupted"])} generations, before the checkpoint at '
+                        f'generation {checkpoint_generation}')
+    resumed_log = logs['interrupted'] + logs['resumed']
+    for generation, (line, resumed_line) in enumerate(zip(logs['uninterrupted'], resumed_log)):
+        if line != resumed_line:
+            raise Exception(f'The resumed run differs from the uninterrupted one at generation {generation}')
+    if len(resumed_log) != len(logs['uninterrupted']):
+        raise Exception(f'The resumed run wrote {len(resumed_log)} generations, the uninterrupted one '
+                        f'{len(logs["uninterrupted"])}')
+    print(f'The resumed run matches the uninterrupted one over {len(resumed_log)} generations', file=stderr)